@@ -0,0 +1,150 @@
+"""Гистограммы времени ответа в памяти процесса и их выдача в формате
+Prometheus.
+
+Каждый воркер gunicorn копит собственные значения, поэтому Prometheus
+должен опрашивать воркеры по отдельности или суммировать ряды по instance.
+"""
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from recipes.cache import stats as cache_stats
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(labels):
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин.
+
+    Ряды различаются набором меток; для каждого хранятся некумулятивные
+    счётчики корзин (последняя — +Inf), сумма и число наблюдений.
+    """
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self.lock:
+            series = [
+                (key, list(counts), total, count)
+                for key, (counts, total, count) in self.series.items()
+            ]
+        for key, counts, total, count in sorted(series):
+            cumulative = 0
+            bounds = [repr(float(bound)) for bound in self.buckets]
+            for bound, bucket in zip(bounds + ['+Inf'], counts):
+                cumulative += bucket
+                labels = format_labels(key + (('le', bound),))
+                yield f'{self.name}_bucket{{{labels}}} {cumulative}'
+            labels = format_labels(key)
+            yield f'{self.name}_sum{{{labels}}} {total}'
+            yield f'{self.name}_count{{{labels}}} {count}'
+
+
+class Counter:
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + 1
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            yield f'{self.name}{{{format_labels(key)}}} {value}'
+
+
+class CacheCounter(Counter):
+    """Отдаёт счётчики попаданий кэша ответов из recipes.cache."""
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        for result in ('hits', 'misses'):
+            labels = format_labels((('result', result),))
+            yield f'{self.name}{{{labels}}} {cache_stats[result]}'
+
+
+requests_total = Counter(
+    'foodgram_requests_total', 'Число запросов по маршруту и статусу.')
+request_seconds = Histogram(
+    'foodgram_request_seconds', 'Полное время обработки запроса.',
+    settings.METRICS_TIME_BUCKETS)
+sql_seconds = Histogram(
+    'foodgram_sql_seconds', 'Суммарное время SQL-запросов за запрос.',
+    settings.METRICS_TIME_BUCKETS)
+sql_queries = Histogram(
+    'foodgram_sql_queries', 'Число SQL-запросов за запрос.',
+    settings.METRICS_QUERY_BUCKETS)
+serializer_seconds = Histogram(
+    'foodgram_serializer_seconds',
+    'Время вычисления serializer.data, включая вложенные сериализаторы.',
+    settings.METRICS_TIME_BUCKETS)
+render_seconds = Histogram(
+    'foodgram_render_seconds',
+    'Время кодирования готовых данных рендерером, без сериализаторов.',
+    settings.METRICS_TIME_BUCKETS)
+response_bytes = Histogram(
+    'foodgram_response_bytes', 'Размер тела ответа.',
+    settings.METRICS_SIZE_BUCKETS)
+api_cache_total = CacheCounter(
+    'foodgram_api_cache_total', 'Обращения к кэшу ответов API.')
+
+REGISTRY = (
+    requests_total,
+    request_seconds,
+    sql_seconds,
+    sql_queries,
+    serializer_seconds,
+    render_seconds,
+    response_bytes,
+    api_cache_total,
+)
+
+
+def render_metrics():
+    return '\n'.join(
+        line for metric in REGISTRY for line in metric.collect()) + '\n'
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
@@ -0,0 +1,174 @@
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.serializers import ListSerializer, Serializer
+
+from foodgram import metrics
+
+logger = logging.getLogger('foodgram.performance')
+
+
+class QueryTimer:
+    """Обёртка execute_wrapper, считающая число и время SQL-запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+def start_profiler():
+    """Включает cProfile для доли запросов PROFILE_SAMPLE_RATE."""
+    if random.random() >= settings.PROFILE_SAMPLE_RATE:
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # в этом потоке уже работает другой профилировщик
+        return None
+    return profiler
+
+
+def format_profile(profiler):
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats(
+        'cumulative').print_stats(settings.PROFILE_TOP)
+    return stream.getvalue()
+
+
+serializer_time = threading.local()
+
+
+def timed_data(getter):
+    """Оборачивает свойство data сериализаторов DRF и копит его время в
+    serializer_time. Считается только внешний вызов: вложенные .data,
+    например в SerializerMethodField, уже входят в его время."""
+    @wraps(getter)
+    def wrapper(serializer):
+        if getattr(serializer_time, 'depth', None) is None:
+            return getter(serializer)
+        serializer_time.depth += 1
+        started = time.perf_counter()
+        try:
+            return getter(serializer)
+        finally:
+            serializer_time.depth -= 1
+            if not serializer_time.depth:
+                serializer_time.seconds += time.perf_counter() - started
+    wrapper.timed = True
+    return wrapper
+
+
+def instrument_serializers():
+    for serializer_class in (Serializer, ListSerializer):
+        getter = serializer_class.data.fget
+        if not getattr(getter, 'timed', False):
+            serializer_class.data = property(timed_data(getter))
+
+
+def counted(content, route, method):
+    size = 0
+    for chunk in content:
+        size += len(chunk)
+        yield chunk
+    metrics.response_bytes.observe(size, route=route, method=method)
+
+
+class MetricsMiddleware:
+    """Собирает по маршрутам время ответа, время и число SQL-запросов,
+    время сериализаторов, время рендеринга и размер ответа.
+
+    DRF вычисляет serializer.data внутри представления, ещё до Response,
+    поэтому время сериализаторов (to_representation, вложенные
+    сериализаторы и их запросы) считается отдельно от времени рендерера,
+    который только кодирует готовые данные в JSON, CSV или PDF.
+
+    Маршрут — имя представления из resolver_match, а не путь, чтобы id в
+    адресах не раздували число рядов. Медленные запросы из выборки
+    PROFILE_SAMPLE_RATE пишутся в лог вместе с профилем cProfile.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_serializers()
+
+    def __call__(self, request):
+        request.render_seconds = None
+        timer = QueryTimer()
+        profiler = start_profiler()
+        serializer_time.depth = 0
+        serializer_time.seconds = 0.0
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timer):
+                response = self.get_response(request)
+        finally:
+            request.serializer_seconds = serializer_time.seconds
+            serializer_time.depth = None
+            if profiler is not None:
+                profiler.disable()
+        elapsed = time.perf_counter() - started
+        route = self.route(request)
+        self.observe(request, response, route, elapsed, timer)
+        if profiler is not None and elapsed >= settings.PROFILE_SLOW_REQUEST:
+            logger.warning(
+                'медленный запрос %s %s (%s): %.3f с, SQL %d за %.3f с\n%s',
+                request.method, request.path, route, elapsed, timer.count,
+                timer.seconds, format_profile(profiler))
+        return response
+
+    def process_template_response(self, request, response):
+        # вызывается последним перед response.render(), так что обратный
+        # вызов после рендеринга измеряет сам рендерер
+        started = time.perf_counter()
+
+        def rendered(response):
+            request.render_seconds = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def route(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unmatched'
+        return match.view_name
+
+    @staticmethod
+    def observe(request, response, route, elapsed, timer):
+        method = request.method
+        metrics.requests_total.inc(
+            route=route, method=method, status=response.status_code)
+        metrics.request_seconds.observe(elapsed, route=route, method=method)
+        metrics.sql_seconds.observe(
+            timer.seconds, route=route, method=method)
+        metrics.sql_queries.observe(timer.count, route=route, method=method)
+        if request.serializer_seconds:
+            metrics.serializer_seconds.observe(
+                request.serializer_seconds, route=route, method=method)
+        if request.render_seconds is not None:
+            metrics.render_seconds.observe(
+                request.render_seconds, route=route, method=method)
+        if response.streaming:
+            response.streaming_content = counted(
+                response.streaming_content, route, method)
+        else:
+            metrics.response_bytes.observe(
+                len(response.content), route=route, method=method)
@@ -0,0 +1,188 @@
+"""Бюджет SQL-запросов на представление и поиск повторяющихся запросов.
+
+Бюджет задаётся атрибутом представления query_budget или декоратором
+limit_queries на функции-представлении или действии ViewSet. Для таких
+представлений повтор одного и того же запроса (с точностью до
+параметров) больше QUERY_BUDGET_DUPLICATES раз считается N+1.
+Представления без бюджета не проверяются.
+"""
+import logging
+import os
+import re
+import sys
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger('foodgram.performance')
+
+IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+SPACES = re.compile(r'\s+')
+# обёртки execute_wrapper самого проекта не считаются местом вызова
+INSTRUMENTATION = {
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    for name in ('query_budget.py', 'middleware.py')
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Запросов больше бюджета или один запрос повторяется слишком часто."""
+
+
+class QueryBudget:
+
+    def __init__(self, queries=None, duplicates=None):
+        self.queries = queries
+        self.duplicates = duplicates
+
+    def duplicates_limit(self):
+        if self.duplicates is None:
+            return settings.QUERY_BUDGET_DUPLICATES
+        return self.duplicates
+
+
+def limit_queries(queries=None, duplicates=None):
+    def decorator(view):
+        view.query_budget = QueryBudget(queries, duplicates)
+        return view
+    return decorator
+
+
+def normalize_sql(sql):
+    """Приводит запросы, отличающиеся только значениями, к одному виду."""
+    sql = IN_LIST.sub('IN (...)', sql)
+    sql = STRING.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+def query_origin():
+    """Ближайшие к запросу кадры стека из кода проекта."""
+    origin = []
+    frame = sys._getframe(2)
+    while frame is not None and len(origin) < settings.QUERY_BUDGET_STACK:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(settings.BASE_DIR)
+                and filename not in INSTRUMENTATION
+                and 'site-packages' not in filename):
+            origin.append('{}:{} in {}'.format(
+                os.path.relpath(filename, settings.BASE_DIR),
+                frame.f_lineno, frame.f_code.co_name))
+        frame = frame.f_back
+    return tuple(origin)
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper, запоминающая запросы и места их вызова."""
+
+    def __init__(self):
+        self.queries = []
+        self.active = True
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.active:
+            self.queries.append((normalize_sql(sql), query_origin()))
+        return execute(sql, params, many, context)
+
+    def groups(self):
+        groups = defaultdict(Counter)
+        for sql, origin in self.queries:
+            groups[sql][origin] += 1
+        return sorted(
+            groups.items(), key=lambda item: -sum(item[1].values()))
+
+    def report(self, budget, label):
+        """Текст нарушения бюджета или None, если бюджет соблюдён."""
+        groups = self.groups()
+        limit = budget.duplicates_limit()
+        repeated = [
+            (sql, origins) for sql, origins in groups
+            if sum(origins.values()) > limit
+        ]
+        over = (budget.queries is not None
+                and len(self.queries) > budget.queries)
+        if not over and not repeated:
+            return None
+        lines = [f'{label}: {len(self.queries)} SQL-запросов']
+        if over:
+            lines[0] += f' при бюджете {budget.queries}'
+        if repeated:
+            lines[0] += f', повторы больше {limit} раз'
+        for sql, origins in repeated or groups:
+            lines.append(f'{sum(origins.values())} × {sql}')
+            lines.extend(
+                '    {} × {}'.format(
+                    count, ' <- '.join(origin) or 'вне кода проекта')
+                for origin, count in origins.most_common()
+            )
+        return '\n'.join(lines)
+
+
+@contextmanager
+def assert_query_budget(queries=None, duplicates=None, label='блок'):
+    """Проверка бюджета для тестов:
+
+        with assert_query_budget(5, duplicates=1):
+            self.client.get(url)
+    """
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder
+    report = recorder.report(QueryBudget(queries, duplicates), label)
+    if report is not None:
+        raise QueryBudgetExceeded(report)
+
+
+def get_view_budget(view_func, method):
+    """Бюджет действия ViewSet, затем класса представления, затем функции;
+    None, если представление бюджет не объявило."""
+    view_class = getattr(view_func, 'cls', None) or getattr(
+        view_func, 'view_class', None)
+    action = getattr(view_func, 'actions', {}).get(method.lower())
+    handler = getattr(view_class, action or method.lower(), None)
+    for owner in (handler, view_class, view_func):
+        budget = getattr(owner, 'query_budget', None)
+        if isinstance(budget, QueryBudget):
+            return budget
+    return None
+
+
+class QueryBudgetMiddleware:
+    """Проверяет бюджет запросов представлений, которые его объявили.
+
+    QUERY_BUDGET_MODE: 'log' (по умолчанию) — предупреждение в лог
+    foodgram.performance; 'raise' — исключение, включается в тестах или
+    явно через переменную окружения; 'off' — проверка отключена. Бюджет
+    проверяется после ответа представления, когда его запись уже
+    зафиксирована, поэтому 'raise' годится только для тестов и отладки.
+    """
+
+    def __init__(self, get_response):
+        if settings.QUERY_BUDGET_MODE == 'off':
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.query_budget = None
+        request.query_recorder = QueryRecorder()
+        with connection.execute_wrapper(request.query_recorder):
+            response = self.get_response(request)
+        if request.query_budget is None:
+            return response
+        report = request.query_recorder.report(
+            request.query_budget, f'{request.method} {request.path}')
+        if report is not None:
+            if settings.QUERY_BUDGET_MODE == 'raise':
+                raise QueryBudgetExceeded(report)
+            logger.warning(report)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_view_budget(view_func, request.method)
+        # без бюджета запросы не нужны: не тратим время на разбор стека
+        request.query_recorder.active = request.query_budget is not None
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
 
 #from dotenv import load_dotenv
 
@@ -19,6 +20,38 @@ import os
 MIN_VALUE_AMOUNT = 1
 MIN_VALUE_COOKING_TIME = 1
 FILE_NAME = 'shopping_list.pdf'
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60
+SHOPPING_LIST_CHUNK_SIZE = 8192
+INGREDIENT_SEARCH_LIMIT = 30
+INGREDIENT_SEARCH_CACHE_SIZE = 1000
+INGREDIENT_INDEX_TTL = 300
+RECIPE_INGREDIENT_INDEX_TTL = 300
+COOK_MAX_MISSING = 5
+IMAGE_RENDITIONS = {
+    'small': (320, 320),
+    'medium': (640, 640),
+}
+IMAGE_QUALITY = 80
+IMAGE_RENDITION_WORKERS = 2
+IMAGE_MAX_SIZE = 5 * 1024 * 1024
+IMAGE_MAX_PIXELS = 4096 * 4096
+IMAGE_DECODE_CHUNK_SIZE = 64 * 1024
+# collect_images не трогает файлы моложе этого числа секунд
+IMAGE_ORPHAN_GRACE = 24 * 60 * 60
+RECIPE_MAX_BODY_SIZE = IMAGE_MAX_SIZE * 2
+SIMILAR_RECIPES_TOP_K = 10
+SIMILAR_RECIPES_TAG_WEIGHT = 0.3
+SIMILAR_RECIPES_MAX_DF = 0.05
+METRICS_ALLOWED_IPS = os.getenv(
+    'METRICS_ALLOWED_IPS', default='127.0.0.1').split(',')
+METRICS_TIME_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+METRICS_SIZE_BUCKETS = (
+    256, 1024, 4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', default=0))
+PROFILE_SLOW_REQUEST = 1.0
+PROFILE_TOP = 30
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -33,6 +66,12 @@ SECRET_KEY = 'h$ltyce5l7i^(f=qqyl*xvf3b+fia@o8vr+mu1a!p*t&c3!^e&'
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
+QUERY_BUDGET_MODE = os.getenv(
+    'QUERY_BUDGET_MODE', default='raise' if TESTING else 'log')
+QUERY_BUDGET_DUPLICATES = 3
+QUERY_BUDGET_STACK = 3
 
 ALLOWED_HOSTS = ['*']
 
@@ -50,10 +89,12 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'rest_framework',
     'users.apps.UsersConfig',
-    'recipes',        # .apps.RecipesConfig
+    'recipes.apps.RecipesConfig',
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.MetricsMiddleware',
+    'foodgram.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -99,6 +140,18 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = 60 * 5
+
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -108,7 +161,7 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'users.paginator.LimitPageNumberPagination',
     'PAGE_SIZE': 6,
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
 }
@@ -183,4 +236,6 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+PDF_FONT_PATH = os.path.join(MEDIA_ROOT, 'fonts', 'DejaVuSans.ttf')
+
 AUTH_USER_MODEL = 'users.User'
@@ -1,7 +1,10 @@
 from django.contrib import admin
 
+from recipes.images import schedule_renditions
 from recipes.models import (BestRecipes, Ingredient, IngredientsInRecipe,
                             Recipe, ShoppingList, Tag)
+from recipes.shopping_cart import get_cart_users, rebuild_carts
+from recipes.similarity import update_similar_on_commit
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -24,10 +27,25 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = [
         IngredientRecipeInline,
     ]
-    list_display = ('id', 'name', 'author', 'get_ingredients')
+    list_display = (
+        'id', 'name', 'author', 'get_ingredients', 'favorites_count')
     list_filter = ('tags',)
     search_fields = ('name', 'author__username', 'author__email',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('ingredients')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            schedule_renditions(obj.image.name)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            rebuild_carts(get_cart_users(form.instance.id))
+        update_similar_on_commit(form.instance.id)
+
     def get_ingredients(self, obj):
         return '\n'.join(
             [str(ingredients) for ingredients in obj.ingredients.all()])
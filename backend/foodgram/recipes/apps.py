@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class RecipesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        import recipes.signals  # noqa: F401
+        from recipes.search import restore_search_triggers
+        post_migrate.connect(restore_search_triggers, sender=self)
+        from recipes.shopping_list import register_fonts
+        register_fonts()
@@ -0,0 +1,124 @@
+import hashlib
+import time
+from collections import Counter
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response, quote_etag
+from rest_framework.response import Response
+
+GENERATION_KEY = 'api:generation:{}'
+RESPONSE_KEY = 'api:response:{}:{}:{}'
+
+stats = Counter()
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def get_generation(name):
+    cache = get_cache()
+    key = GENERATION_KEY.format(name)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(*names):
+    """Делает недействительными все ответы, закэшированные для names.
+
+    Номер поколения входит в ключ ответа, поэтому старые записи просто
+    перестают читаться и вытесняются по таймауту. Если счётчик был
+    вытеснен из кэша, новый стартует со времени, а не с единицы, чтобы
+    не совпасть со старым поколением.
+    """
+    cache = get_cache()
+    for name in names:
+        key = GENERATION_KEY.format(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def bump_generation_on_commit(*names):
+    transaction.on_commit(lambda: bump_generation(*names))
+
+
+def user_generation_name(user_id):
+    return f'user:{user_id}'
+
+
+def normalized_query(request):
+    return urlencode(sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+    ))
+
+
+def response_key(request, generation_names):
+    digest = hashlib.md5(
+        f'{request.get_host()}{request.path}?{normalized_query(request)}'
+        .encode()
+    ).hexdigest()
+    return RESPONSE_KEY.format(
+        ','.join(generation_names),
+        ','.join(str(get_generation(name)) for name in generation_names),
+        digest)
+
+
+def cache_for_anonymous(method):
+    """Кэширует ответы метода представления для анонимных GET-запросов.
+
+    Группа инвалидации берётся из атрибута cache_generation представления,
+    а вместе с ней — группы etag_generations, которые ConditionalGetMixin
+    включает в ETag: иначе новый ETag отдавался бы со старым телом.
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.method != 'GET' or not request.user.is_anonymous:
+            return method(self, request, *args, **kwargs)
+        cache = get_cache()
+        key = response_key(request, (
+            self.cache_generation,
+            *getattr(self, 'etag_generations', ())))
+        data = cache.get(key)
+        if data is not None:
+            stats['hits'] += 1
+            return Response(data)
+        stats['misses'] += 1
+        response = method(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+        return response
+    return wrapper
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(
+        ':'.join(map(str, parts)).encode()).hexdigest())
+
+
+def conditional_get(method):
+    """Отвечает 304 Not Modified, не вызывая сериализацию.
+
+    ETag возвращает метод представления get_etag(request).
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        response = (
+            etag and get_conditional_response(request, etag=etag)
+            or method(self, request, *args, **kwargs)
+        )
+        if etag and response.status_code in (200, 304):
+            response['ETag'] = etag
+        return response
+    return wrapper
@@ -0,0 +1,113 @@
+import binascii
+import re
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import (TemporaryUploadedFile,
+                                            UploadedFile)
+from PIL import Image
+from rest_framework import serializers
+
+from recipes.images import rendition_urls
+
+IMAGE_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+
+
+# как base64.b64decode без validate: всё вне алфавита (переводы строк
+# MIME-переноса, пробелы) отбрасывается
+NOT_BASE64 = re.compile(r'[^A-Za-z0-9+/=]')
+
+
+def encoded_size(size):
+    return (size + 2) // 3 * 4
+
+
+class RenditionsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки рецепта."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'image')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        urls = rendition_urls(value.name)
+        request = self.context.get('request')
+        if request is not None:
+            for formats in urls.values():
+                for extension, url in formats.items():
+                    formats[extension] = request.build_absolute_uri(url)
+        return urls
+
+
+class BoundedImageField(serializers.ImageField):
+    """Картинка строкой base64 или файлом из multipart.
+
+    Размер строки проверяется до декодирования, декодирование идёт
+    частями во временный файл, а число пикселей сверяется по заголовку
+    до того, как Pillow распакует картинку целиком.
+    """
+
+    default_error_messages = {
+        'too_large': 'Размер картинки не может превышать {max_size} байт.',
+        'too_many_pixels': (
+            'Картинка не может быть больше {max_pixels} пикселей.'),
+        'invalid_base64': 'Картинка должна быть строкой base64.',
+        'invalid_format': 'Поддерживаются форматы: {formats}.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = self.decode(data)
+        elif not isinstance(data, UploadedFile):
+            self.fail('invalid_base64')
+        elif data.size > settings.IMAGE_MAX_SIZE:
+            self.fail('too_large', max_size=settings.IMAGE_MAX_SIZE)
+        try:
+            self.check_header(data)
+            return super().to_internal_value(data)
+        except serializers.ValidationError:
+            data.close()
+            raise
+
+    def decode(self, data):
+        if ';base64,' in data[:100]:
+            data = data[data.index(';base64,') + len(';base64,'):]
+        data = NOT_BASE64.sub('', data)
+        if len(data) > encoded_size(settings.IMAGE_MAX_SIZE):
+            self.fail('too_large', max_size=settings.IMAGE_MAX_SIZE)
+        # куски кратны 4 символам, чтобы не резать группы base64
+        chunk_size = settings.IMAGE_DECODE_CHUNK_SIZE // 4 * 4
+        file = TemporaryUploadedFile(
+            str(uuid.uuid4()), None, len(data) * 3 // 4, None)
+        try:
+            for start in range(0, len(data), chunk_size):
+                file.write(binascii.a2b_base64(
+                    data[start:start + chunk_size]))
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
+    def check_header(self, file):
+        try:
+            image = Image.open(file)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            self.fail('invalid_image')
+        width, height = image.size
+        file.seek(0)
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            self.fail(
+                'too_many_pixels', max_pixels=settings.IMAGE_MAX_PIXELS)
+        if image.format not in IMAGE_EXTENSIONS:
+            self.fail('invalid_format', formats=', '.join(IMAGE_EXTENSIONS))
+        if isinstance(file, TemporaryUploadedFile) and '.' not in file.name:
+            file.name = f'{file.name}.{IMAGE_EXTENSIONS[image.format]}'
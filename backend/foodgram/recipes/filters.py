@@ -1,19 +1,25 @@
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe
+from recipes.models import Recipe, Tag
+from recipes.search import search_recipes
 
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all()
+    )
     is_favorited = filters.BooleanFilter(method='filter_best_recipes')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_shopping_list'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
 
     def filter_best_recipes(self, queryset, name, value):
         if self.request.user.is_authenticated and value is True:
@@ -25,6 +31,5 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(basket__user=self.request.user)
         return queryset
 
-
-class CustomSearchFilter(SearchFilter):
-    search_param = 'name'
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
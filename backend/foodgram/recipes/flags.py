@@ -0,0 +1,60 @@
+from recipes.models import BestRecipes, ShoppingList
+from users.models import Follow
+
+
+class UserFlags:
+    """Избранное, корзина и подписки текущего пользователя.
+
+    Наборы id подгружаются пачками для всех объектов страницы и живут
+    до конца запроса, поэтому вложенные сериализаторы отвечают из памяти.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.favorites = set()
+        self.shopping_cart = set()
+        self.following = set()
+        self._recipes = set()
+        self._authors = set()
+
+    def load_recipes(self, recipe_ids):
+        recipe_ids = set(recipe_ids) - self._recipes
+        if not recipe_ids or self.user.is_anonymous:
+            return
+        self.favorites.update(BestRecipes.objects.filter(
+            user=self.user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+        self.shopping_cart.update(ShoppingList.objects.filter(
+            user=self.user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+        self._recipes |= recipe_ids
+
+    def load_authors(self, author_ids):
+        author_ids = set(author_ids) - self._authors
+        if not author_ids or self.user.is_anonymous:
+            return
+        self.following.update(Follow.objects.filter(
+            user=self.user, author_id__in=author_ids
+        ).values_list('author_id', flat=True))
+        self._authors |= author_ids
+
+    def is_favorited(self, recipe):
+        self.load_recipes((recipe.id,))
+        return recipe.id in self.favorites
+
+    def is_in_shopping_cart(self, recipe):
+        self.load_recipes((recipe.id,))
+        return recipe.id in self.shopping_cart
+
+    def is_subscribed(self, author):
+        self.load_authors((author.id,))
+        return author.id in self.following
+
+
+def get_user_flags(context):
+    request = context['request']
+    flags = getattr(request, 'user_flags', None)
+    if flags is None:
+        flags = UserFlags(request.user)
+        request.user_flags = flags
+    return flags
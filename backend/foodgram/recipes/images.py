@@ -0,0 +1,80 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+FORMATS = {
+    'webp': 'WEBP',
+    'jpg': 'JPEG',
+}
+
+executor = None
+
+
+def rendition_name(name, size, extension):
+    return f'{os.path.splitext(name)[0]}_{size}.{extension}'
+
+
+def rendition_names(name):
+    return [
+        rendition_name(name, size, extension)
+        for size in settings.IMAGE_RENDITIONS
+        for extension in FORMATS
+    ]
+
+
+def make_renditions(name, storage=None, force=True):
+    """Сохраняет рядом с картинкой уменьшенные копии в WebP и JPEG."""
+    storage = storage or default_storage
+    if not force and all(map(storage.exists, rendition_names(name))):
+        return 0
+    with storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    created = 0
+    for size, box in settings.IMAGE_RENDITIONS.items():
+        resized = image.copy()
+        resized.thumbnail(box, Image.LANCZOS)
+        for extension, image_format in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(
+                buffer, image_format, quality=settings.IMAGE_QUALITY)
+            path = rendition_name(name, size, extension)
+            if storage.exists(path):
+                storage.delete(path)
+            storage.save(path, ContentFile(buffer.getvalue()))
+            created += 1
+    return created
+
+
+def schedule_renditions(name):
+    """Готовит копии в фоновом потоке после фиксации транзакции.
+
+    Имена картинок зависят от содержимого, поэтому готовые копии
+    не пересоздаются.
+    """
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_RENDITION_WORKERS,
+            thread_name_prefix='renditions')
+    transaction.on_commit(lambda: executor.submit(
+        make_renditions, name, force=False))
+
+
+def rendition_urls(name):
+    return {
+        size: {
+            extension: default_storage.url(
+                rendition_name(name, size, extension))
+            for extension in FORMATS
+        }
+        for size in settings.IMAGE_RENDITIONS
+    }
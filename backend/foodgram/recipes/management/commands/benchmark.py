@@ -0,0 +1,210 @@
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import Future
+from itertools import combinations
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADE'
+    'lEQVR4nGNgYGAAAAAEAAH2FzhVAAAAAElFTkSuQmCC'
+)
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Перцентиль по ближайшему рангу из отсортированного списка."""
+    index = max(0, -(-len(values) * rank // 100) - 1)
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку, число SQL-запросов и пик памяти основных '
+            'эндпоинтов на текущей базе и сравнивает с сохранённым '
+            'результатом. Все изменения откатываются, картинки пишутся во '
+            'временный MEDIA_ROOT; обработчики on_commit (похожие рецепты, '
+            'превью) выполняются сразу после запроса и входят в замер.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--only', default='',
+            help='запускать только сценарии, в названии которых есть строка')
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='очищать кэш ответов перед каждым запросом')
+        parser.add_argument('--save', help='записать результаты в JSON')
+        parser.add_argument(
+            '--baseline', help='сравнить с результатами из JSON')
+        parser.add_argument(
+            '--tolerance', type=float, default=1.25,
+            help='во сколько раз p95 может превысить базовый')
+
+    def handle(self, *args, **options):
+        self.options = options
+        results = {}
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root), \
+                    transaction.atomic():
+                for name, scenario in self.scenarios():
+                    if options['only'] in name:
+                        results[name] = self.measure(scenario)
+                        self.report(name, results[name])
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.compare(results, options['baseline'])
+
+    def scenarios(self):
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        user = User.objects.annotate(
+            carts=Count('basket')).order_by('-carts').first()
+        tag = Tag.objects.first()
+        if recipe is None or user is None or tag is None:
+            raise CommandError(
+                'база пуста, сначала запустите generate_dataset')
+        anonymous = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        yield from self.list_scenarios(anonymous, client, tag, recipe)
+        detail = f'/api/recipes/{recipe.id}/'
+        yield 'detail anonymous', lambda: anonymous.get(detail)
+        yield 'detail', lambda: client.get(detail)
+        yield from self.write_scenarios(client, tag)
+        yield 'subscriptions', lambda: client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 3})
+        yield 'feed', lambda: client.get('/api/recipes/feed/')
+        for renderer in ('pdf', 'csv'):
+            yield f'download_shopping_cart {renderer}', (
+                lambda renderer=renderer: b''.join(client.get(
+                    '/api/recipes/download_shopping_cart/',
+                    {'format': renderer}).streaming_content))
+
+    def list_scenarios(self, anonymous, client, tag, recipe):
+        filters = {
+            'tags': tag.slug,
+            'author': recipe.author_id,
+            'is_favorited': 1,
+            'is_in_shopping_cart': 1,
+            'search': recipe.name.split()[0],
+        }
+        yield 'list anonymous', lambda: anonymous.get('/api/recipes/')
+        for size in range(len(filters) + 1):
+            for names in combinations(filters, size):
+                params = {name: filters[name] for name in names}
+                yield f'list {"+".join(names) or "all"}', (
+                    lambda params=params: client.get(
+                        '/api/recipes/', params))
+
+    def write_scenarios(self, client, tag):
+        ingredients = list(Ingredient.objects.values_list('id', flat=True)[:8])
+        payload = {
+            'name': 'бенчмарк',
+            'text': 'описание',
+            'cooking_time': 10,
+            'tags': [tag.id],
+            'image': IMAGE,
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 10}
+                for ingredient_id in ingredients
+            ],
+        }
+        yield 'create', lambda: client.post(
+            '/api/recipes/', payload, format='json')
+        # правка и переключатели работают со своим свежим рецептом: чужой
+        # рецепт править нельзя, а уже добавленный в избранное даст 400
+        own = client.post('/api/recipes/', payload, format='json')
+        detail = f'/api/recipes/{own.data["id"]}/'
+        patch = {'ingredients': payload['ingredients'][::2]}
+        yield 'patch', lambda: client.patch(detail, patch, format='json')
+        for action in ('favorite', 'shopping_cart'):
+            url = f'{detail}{action}/'
+            yield f'{action} toggle', (
+                lambda url=url: (client.post(url), client.delete(url)))
+
+    def measure(self, scenario):
+        for _ in range(self.options['warmup']):
+            self.call(scenario)
+        timings = []
+        queries = 0
+        for _ in range(self.options['iterations']):
+            with CaptureQueriesContext(connection) as captured:
+                timings.append(self.call(scenario))
+            queries = max(queries, len(captured))
+        tracemalloc.start()
+        self.call(scenario)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        timings.sort()
+        result = {
+            f'p{rank}': round(percentile(timings, rank) * 1000, 2)
+            for rank in PERCENTILES
+        }
+        result['rps'] = round(len(timings) / sum(timings), 1)
+        result['queries'] = queries
+        result['peak_kb'] = round(peak / 1024)
+        return result
+
+    def call(self, scenario):
+        if self.options['cold']:
+            cache.clear()
+        started = time.perf_counter()
+        scenario()
+        self.run_on_commit()
+        return time.perf_counter() - started
+
+    @staticmethod
+    def run_on_commit():
+        """Выполняет отложенные до коммита обработчики: внешняя транзакция
+        откатывается, и иначе их работа не попала бы в замер. Фоновые
+        задачи (превью картинок) дожидаются завершения."""
+        while connection.run_on_commit:
+            hooks, connection.run_on_commit = connection.run_on_commit, []
+            for _, hook in hooks:
+                result = hook()
+                if isinstance(result, Future):
+                    result.result()
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<60} p50 {result["p50"]:>8} мс  p95 {result["p95"]:>8} '
+            f'мс  p99 {result["p99"]:>8} мс  {result["rps"]:>7}/с  '
+            f'SQL {result["queries"]:>3}  память {result["peak_kb"]:>6} КБ')
+
+    def compare(self, results, path):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['p95'] > base['p95'] * self.options['tolerance']:
+                regressions.append(
+                    f'{name}: p95 {base["p95"]} -> {result["p95"]} мс')
+            if result['queries'] > base['queries']:
+                regressions.append(
+                    f'{name}: SQL {base["queries"]} -> {result["queries"]}')
+        if regressions:
+            raise CommandError(
+                'регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('регрессий нет'))
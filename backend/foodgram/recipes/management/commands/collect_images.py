@@ -0,0 +1,77 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.cache import bump_generation
+from recipes.images import rendition_names
+from recipes.models import Recipe
+
+SKIP_DIRECTORIES = ('fonts',)
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки рецептов в хранилище по хешу содержимого '
+            'и удаляет файлы, на которые не ссылается ни один рецепт и '
+            'которые не менялись дольше IMAGE_ORPHAN_GRACE секунд')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='только показать, что будет сделано'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        moved = self.move_to_hashed_names(dry_run)
+        keep = set()
+        for name in Recipe.objects.values_list('image', flat=True):
+            keep.add(name)
+            keep.update(rendition_names(name))
+        # свежий файл может принадлежать ещё не зафиксированному рецепту
+        cutoff = timezone.now() - timedelta(
+            seconds=settings.IMAGE_ORPHAN_GRACE)
+        orphans = [
+            name for name in self.walk('')
+            if name not in keep
+            and default_storage.get_modified_time(name) < cutoff
+        ]
+        for name in orphans:
+            self.stdout.write(f'удаляю {name}')
+            if not dry_run:
+                default_storage.delete(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'перенесено картинок: {moved}, удалено файлов: {len(orphans)}'))
+
+    def move_to_hashed_names(self, dry_run):
+        storage = Recipe.image.field.storage
+        prefix = f'{storage.directory}/'
+        recipes = Recipe.objects.exclude(image='').exclude(
+            image__startswith=prefix).values_list('pk', 'image')
+        moved = 0
+        for pk, name in recipes.iterator():
+            if not storage.exists(name):
+                self.stderr.write(f'рецепт {pk}: нет файла {name}')
+                continue
+            moved += 1
+            if dry_run:
+                continue
+            with storage.open(name) as file:
+                hashed = storage.save(name, file)
+            Recipe.objects.filter(pk=pk).update(
+                image=hashed, updated=timezone.now())
+        if moved and not dry_run:
+            bump_generation('recipes')
+        return moved
+
+    def walk(self, path):
+        directories, files = default_storage.listdir(path)
+        for name in files:
+            yield os.path.join(path, name)
+        for directory in directories:
+            if path or directory not in SKIP_DIRECTORIES:
+                yield from self.walk(os.path.join(path, directory))
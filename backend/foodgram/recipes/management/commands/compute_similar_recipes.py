@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import compute_similar
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие рецепты по ингредиентам и тегам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=settings.SIMILAR_RECIPES_TOP_K,
+            help='сколько похожих рецептов хранить для каждого'
+        )
+
+    def handle(self, *args, **options):
+        rows = compute_similar(options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f'сохранено пар: {rows}'))
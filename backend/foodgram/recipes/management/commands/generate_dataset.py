@@ -0,0 +1,209 @@
+import bisect
+import io
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from recipes.cache import bump_generation
+from recipes.management.commands._private import (analyze_tables, insert_rows,
+                                                  reset_sequences)
+from recipes.models import (BestRecipes, Ingredient, IngredientsInRecipe,
+                            Recipe, ShoppingList, Tag)
+from recipes.search import ingredient_index, recipe_ingredient_index
+from users.models import Follow, User
+
+DISHES = ('борщ', 'суп', 'салат', 'омлет', 'пирог', 'рагу', 'каша',
+          'плов', 'запеканка', 'паста', 'котлеты', 'блины')
+ADJECTIVES = ('домашний', 'быстрый', 'постный', 'праздничный', 'летний',
+              'острый', 'сытный', 'классический')
+WORDS = ('нарезать', 'обжарить', 'варить', 'добавить', 'посолить',
+         'перемешать', 'запечь', 'остудить', 'подавать', 'луком',
+         'сметаной', 'зеленью', 'чесноком', 'минут', 'огне', 'духовке')
+SECONDS_IN_YEAR = 365 * 24 * 60 * 60
+
+
+class ZipfSampler:
+    """Выбирает индексы 0..size-1 с вероятностью ~ 1 / (i + 1) ** skew:
+    немногие элементы популярны, остальные образуют длинный хвост."""
+
+    def __init__(self, size, skew, rng):
+        self.size = size
+        self.rng = rng
+        self.cum_weights = list(accumulate(
+            1 / (i + 1) ** skew for i in range(size)))
+
+    def __call__(self):
+        point = self.rng.random() * self.cum_weights[-1]
+        return min(bisect.bisect(self.cum_weights, point), self.size - 1)
+
+    def distinct(self, count):
+        count = min(count, self.size // 2 or self.size)
+        chosen = set()
+        while len(chosen) < count:
+            chosen.add(self())
+        return chosen
+
+
+class Command(BaseCommand):
+    help = ('Создаёт синтетических пользователей, рецепты, подписки, '
+            'избранное и списки покупок для нагрузочных тестов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=8)
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=2000,
+            help='сколько ингредиентов создать, если справочник пуст'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.1,
+            help='показатель распределения Ципфа для популярности'
+        )
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.skew = options['skew']
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        prefix = f'gen{options["seed"]}_'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'пользователи {prefix}* уже есть, укажите другой --seed')
+        started = time.monotonic()
+        with transaction.atomic():
+            ingredient_ids = self.ensure_ingredients(options['ingredients'])
+            tag_ids = self.ensure_tags(options['tags'])
+            user_ids = self.create_users(options['users'], prefix)
+            recipe_ids = self.create_recipes(options['recipes'], user_ids)
+            self.create_relations(user_ids, recipe_ids, ingredient_ids,
+                                  tag_ids)
+            reset_sequences(User, Recipe)
+            call_command('recount_counters', stdout=io.StringIO())
+            call_command('rebuild_shopping_carts', stdout=io.StringIO())
+        analyze_tables()
+        bump_generation('recipes', 'tags', 'ingredients', 'counters')
+        ingredient_index.invalidate()
+        recipe_ingredient_index.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'готово за {time.monotonic() - started:.1f} с'))
+
+    def write(self, label, model, fields, rows):
+        started = time.monotonic()
+        count = insert_rows(model, fields, rows, self.batch_size)
+        self.stdout.write(
+            f'{label}: {count} за {time.monotonic() - started:.1f} с')
+
+    def ensure_ingredients(self, count):
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+                for i in range(count)
+            )
+        return list(Ingredient.objects.order_by('id').values_list(
+            'id', flat=True))
+
+    def ensure_tags(self, count):
+        for i in range(count):
+            Tag.objects.get_or_create(
+                slug=f'tag-{i}',
+                defaults={'name': f'тег {i}', 'color': f'#{i:06x}'}
+            )
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def next_id(self, model):
+        return (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+    def create_users(self, count, prefix):
+        first_id = self.next_id(User)
+        password = make_password('password')
+        self.write('пользователи', User, (
+            'id', 'password', 'username', 'email', 'first_name',
+            'last_name', 'is_superuser', 'is_staff', 'is_active',
+            'date_joined', 'recipes_count', 'followers_count',
+        ), (
+            (first_id + i, password, f'{prefix}{i}',
+             f'{prefix}{i}@example.com', 'Имя', 'Фамилия', False, False,
+             True, self.now, 0, 0)
+            for i in range(count)
+        ))
+        return list(range(first_id, first_id + count))
+
+    def create_recipes(self, count, user_ids):
+        first_id = self.next_id(Recipe)
+        author = ZipfSampler(len(user_ids), self.skew, self.rng)
+        rng = self.rng
+
+        def rows():
+            for i in range(count):
+                pub_date = self.now - timedelta(
+                    seconds=rng.randrange(SECONDS_IN_YEAR))
+                yield (
+                    first_id + i,
+                    f'{rng.choice(DISHES)} {rng.choice(ADJECTIVES)}'[:100],
+                    user_ids[author()],
+                    'images/generated.png',
+                    ' '.join(rng.choices(WORDS, k=rng.randint(5, 40))),
+                    rng.randint(5, 180),
+                    pub_date, pub_date, 0, 0,
+                )
+
+        self.write('рецепты', Recipe, (
+            'id', 'name', 'author', 'image', 'text', 'cooking_time',
+            'pub_date', 'updated', 'favorites_count', 'shopping_cart_count',
+        ), rows())
+        return list(range(first_id, first_id + count))
+
+    def create_relations(self, user_ids, recipe_ids, ingredient_ids,
+                         tag_ids):
+        rng = self.rng
+        ingredient = ZipfSampler(len(ingredient_ids), self.skew, rng)
+        tag = ZipfSampler(len(tag_ids), self.skew, rng)
+        author = ZipfSampler(len(user_ids), self.skew, rng)
+        recipe = ZipfSampler(len(recipe_ids), self.skew, rng)
+        self.write('ингредиенты в рецептах', IngredientsInRecipe, (
+            'recipe', 'ingredient', 'amount',
+        ), (
+            (recipe_id, ingredient_ids[i], rng.randint(1, 500))
+            for recipe_id in recipe_ids
+            for i in ingredient.distinct(rng.randint(3, 12))
+        ))
+        self.write('теги рецептов', Recipe.tags.through, (
+            'recipe', 'tag',
+        ), (
+            (recipe_id, tag_ids[i])
+            for recipe_id in recipe_ids
+            for i in tag.distinct(rng.randint(1, 3))
+        ))
+        self.write('подписки', Follow, ('user', 'author'), (
+            (user_id, user_ids[i])
+            for user_id in user_ids
+            for i in author.distinct(self.long_tail(100))
+            if user_ids[i] != user_id
+        ))
+        for label, model, limit in (('избранное', BestRecipes, 200),
+                                    ('списки покупок', ShoppingList, 20)):
+            self.write(label, model, ('user', 'recipe'), (
+                (user_id, recipe_ids[i])
+                for user_id in user_ids
+                for i in recipe.distinct(self.long_tail(limit))
+            ))
+
+    def long_tail(self, limit):
+        """Число связей пользователя: у большинства несколько,
+        у немногих — до limit."""
+        return min(int(self.rng.paretovariate(1.2)) - 1, limit)
@@ -1,16 +1,65 @@
-import json
+import os
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.cache import bump_generation
+from recipes.management.commands._private import READERS
 from recipes.models import Ingredient
+from recipes.search import ingredient_index
 
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV- или JSON-файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'ingredients.json'),
+            help='файл .csv (название,единица) или .json'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='только посчитать новые ингредиенты, ничего не записывая'
+        )
+
     def handle(self, *args, **options):
-        with open('ingredients.json', 'rb') as f:
-            data = json.load(f)
-            for i in data:
-                ingredient = Ingredient()
-                ingredient.name = i['name']
-                ingredient.measurement_unit = i['measurement_unit']
-                ingredient.save()
-                print(i['name'], i['measurement_unit'])
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('поддерживаются только файлы .csv и .json')
+        batch_size = options['batch_size']
+        seen = set(
+            Ingredient.objects.values_list('name', 'measurement_unit'))
+        batch = []
+        read = created = 0
+        with open(path, encoding='utf-8') as file:
+            for name, measurement_unit in reader(file):
+                read += 1
+                key = (name.strip(), measurement_unit.strip())
+                if key in seen:
+                    continue
+                seen.add(key)
+                batch.append(
+                    Ingredient(name=key[0], measurement_unit=key[1]))
+                if len(batch) >= batch_size:
+                    created += self.write(batch, options['dry_run'])
+                    self.stdout.write(
+                        f'прочитано {read}, добавлено {created}')
+                    batch = []
+        created += self.write(batch, options['dry_run'])
+        if created and not options['dry_run']:
+            # bulk_create не шлёт post_save, кэш сбрасывается явно
+            bump_generation('ingredients', 'recipes')
+            ingredient_index.invalidate()
+        action = 'будет добавлено' if options['dry_run'] else 'добавлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'прочитано {read}, {action} {created}'))
+
+    def write(self, batch, dry_run):
+        if batch and not dry_run:
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        return len(batch)
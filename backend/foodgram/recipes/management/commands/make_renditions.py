@@ -0,0 +1,37 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from recipes.images import make_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Готовит уменьшенные копии картинок существующих рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None)
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='пересоздать уже существующие копии'
+        )
+
+    def handle(self, *args, **options):
+        names = set(
+            Recipe.objects.exclude(image='').values_list('image', flat=True))
+        created = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(make_renditions, name, force=options['force']):
+                name for name in names
+            }
+            for future in as_completed(futures):
+                try:
+                    created += future.result()
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'картинок: {len(names)}, создано копий: {created}, '
+            f'ошибок: {failed}'))
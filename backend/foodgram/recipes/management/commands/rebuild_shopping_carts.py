@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.shopping_cart import rebuild_carts
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает итоговые списки покупок пользователей'
+
+    def handle(self, *args, **options):
+        rebuild_carts()
+        self.stdout.write(self.style.SUCCESS('списки покупок пересобраны'))
@@ -0,0 +1,64 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'favorites'),
+    ('recipes.Recipe', 'shopping_cart_count', 'basket'),
+    ('users.User', 'recipes_count', 'recipe'),
+    ('users.User', 'followers_count', 'following'),
+)
+
+
+def recount(model, field, relation, check=False):
+    """Сверяет счётчик field с числом связей relation.
+
+    Возвращает [(obj, stored)] для расходящихся объектов; без check
+    исправляет их. Принимает и исторические модели, поэтому тем же
+    кодом счётчики заполняются в миграции.
+    """
+    stale = []
+    queryset = model.objects.annotate(
+        actual=Count(relation)).only('pk', field)
+    for obj in queryset:
+        stored = getattr(obj, field)
+        if stored != obj.actual:
+            setattr(obj, field, obj.actual)
+            stale.append((obj, stored))
+    if stale and not check:
+        model.objects.bulk_update(
+            [obj for obj, _ in stale], (field,), batch_size=500)
+    return stale
+
+
+def recount_all(app_registry=apps, check=False):
+    for label, field, relation in COUNTERS:
+        model = app_registry.get_model(label)
+        for obj, stored in recount(model, field, relation, check):
+            yield model, field, obj, stored
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, покупок и подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='только сообщить о расхождениях, ничего не исправляя'
+        )
+
+    def handle(self, *args, **options):
+        drift = 0
+        with transaction.atomic():
+            for model, field, obj, stored in recount_all(
+                    check=options['check']):
+                self.stdout.write(
+                    f'{model.__name__} {obj.pk}: {field} '
+                    f'{stored} -> {getattr(obj, field)}')
+                drift += 1
+        if drift:
+            self.stdout.write(self.style.WARNING(f'расхождений: {drift}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('счётчики в порядке'))
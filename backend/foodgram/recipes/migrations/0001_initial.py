@@ -0,0 +1,90 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:53
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BestRecipes',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'избранное',
+                'verbose_name_plural': 'избранное',
+            },
+        ),
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='название ингридиента')),
+                ('measurement_unit', models.CharField(max_length=30, verbose_name='единицы измерения')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент',
+                'verbose_name_plural': 'Ингредиенты',
+                'ordering': ('name',),
+            },
+        ),
+        migrations.CreateModel(
+            name='IngredientsInRecipe',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1, 'слишком малое значение')], verbose_name='количество')),
+            ],
+            options={
+                'verbose_name': 'кол-во ингридиентов в рецепте',
+                'verbose_name_plural': 'кол-во ингридиентов в рецептах',
+            },
+        ),
+        migrations.CreateModel(
+            name='Recipe',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='название рецепта')),
+                ('image', models.ImageField(upload_to='', verbose_name='картинка')),
+                ('text', models.TextField(help_text='введите описание рецепта', max_length=500, verbose_name='описание рецепта')),
+                ('cooking_time', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1, 'слишком малое значение')], verbose_name='время приготовления')),
+                ('pub_date', models.DateTimeField(auto_now_add=True, verbose_name='дата публикации')),
+            ],
+            options={
+                'verbose_name': 'рецепт',
+                'verbose_name_plural': 'рецепты',
+                'ordering': ('-pub_date',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30, unique=True, verbose_name='название')),
+                ('color', models.CharField(max_length=10, null=True, unique=True, verbose_name='цветовой код')),
+                ('slug', models.SlugField(max_length=90, null=True, unique=True, verbose_name='слаг')),
+            ],
+            options={
+                'verbose_name': 'тэг',
+                'verbose_name_plural': 'тэги',
+            },
+        ),
+        migrations.CreateModel(
+            name='ShoppingList',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='basket', to='recipes.Recipe', verbose_name='рецепт')),
+            ],
+            options={
+                'verbose_name': 'список покупок',
+                'verbose_name_plural': 'списки покупок',
+            },
+        ),
+    ]
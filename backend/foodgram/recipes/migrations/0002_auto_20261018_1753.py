@@ -0,0 +1,70 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppinglist',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='basket', to=settings.AUTH_USER_MODEL, verbose_name='пользователь'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Автор'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients',
+            field=models.ManyToManyField(through='recipes.IngredientsInRecipe', to='recipes.Ingredient'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags',
+            field=models.ManyToManyField(related_name='tags', to='recipes.Tag', verbose_name='Тэг'),
+        ),
+        migrations.AddField(
+            model_name='ingredientsinrecipe',
+            name='ingredient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredients_amount', to='recipes.Ingredient', verbose_name='рецепт'),
+        ),
+        migrations.AddField(
+            model_name='ingredientsinrecipe',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredients_amount', to='recipes.Recipe'),
+        ),
+        migrations.AddField(
+            model_name='bestrecipes',
+            name='recipe',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to='recipes.Recipe', verbose_name='рецепт'),
+        ),
+        migrations.AddField(
+            model_name='bestrecipes',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to=settings.AUTH_USER_MODEL, verbose_name='пользователь'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglist',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_basket'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientsinrecipe',
+            constraint=models.UniqueConstraint(fields=('ingredient', 'recipe'), name='unique_ing_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='bestrecipes',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_recipe'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:59
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    # до ограничения одинаковые ингредиенты могли появиться несколько раз:
+    # оставляем запись с наименьшим id, переносим на неё рецепты (складывая
+    # количества, если в рецепте есть обе) и удаляем остальные
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientsInRecipe = apps.get_model('recipes', 'IngredientsInRecipe')
+    groups = Ingredient.objects.values('name', 'measurement_unit').annotate(
+        keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in groups:
+        keep = group['keep']
+        duplicates = Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit'],
+        ).exclude(id=keep)
+        rows = IngredientsInRecipe.objects.filter(ingredient__in=duplicates)
+        for row in rows.order_by('id'):
+            kept, created = IngredientsInRecipe.objects.get_or_create(
+                recipe_id=row.recipe_id, ingredient_id=keep,
+                defaults={'amount': row.amount})
+            if not created:
+                kept.amount += row.amount
+                kept.save(update_fields=['amount'])
+            row.delete()
+        duplicates.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
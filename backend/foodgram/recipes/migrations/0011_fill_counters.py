@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from recipes.management.commands.recount_counters import recount_all
+
+
+def fill_counters(apps, schema_editor):
+    # 0003_counters и users.0002_counters добавили счётчики с нулями;
+    # без пересчёта удаление старой связи уводит счётчик ниже нуля
+    for _ in recount_all(apps):
+        pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_search'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
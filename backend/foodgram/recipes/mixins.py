@@ -1,6 +1,49 @@
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
 from rest_framework.viewsets import GenericViewSet
 
+from recipes.cache import (cache_for_anonymous, conditional_get,
+                           get_generation, make_etag, normalized_query,
+                           user_generation_name)
+
+
+class ConditionalGetMixin:
+    """ETag для list и retrieve по номерам поколений из кэша.
+
+    Используется вместе с AnonymousCacheMixin: берёт из него
+    cache_generation, а дополнительные группы — из etag_generations.
+    """
+    etag_generations = ()
+
+    def get_etag(self, request):
+        user = request.user
+        parts = [
+            get_generation(name)
+            for name in (self.cache_generation, *self.etag_generations)
+        ]
+        if not user.is_anonymous:
+            parts += [user.id, get_generation(user_generation_name(user.id))]
+        return make_etag(request.path, normalized_query(request), *parts)
+
+    @conditional_get
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class AnonymousCacheMixin:
+    cache_generation = None
+
+    @cache_for_anonymous
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_for_anonymous
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class ListRetriveViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet):
     pass
@@ -3,6 +3,8 @@ from django.core.validators import MinValueValidator
 from django.db import models
 from foodgram.settings import MIN_VALUE_COOKING_TIME, MIN_VALUE_AMOUNT
 
+from recipes.storage import recipe_image_storage
+
 User = get_user_model()
 
 
@@ -47,6 +49,11 @@ class Ingredient(models.Model):
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'),
+        )
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -60,7 +67,8 @@ class Recipe(models.Model):
         verbose_name='Автор'
     )
     image = models.ImageField(
-        verbose_name='картинка'
+        verbose_name='картинка',
+        storage=recipe_image_storage
     )
     text = models.TextField(
         max_length=500,
@@ -85,11 +93,32 @@ class Recipe(models.Model):
         'дата публикации',
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        'дата изменения',
+        auto_now=True
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='в избранном',
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='в списках покупок',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_id_idx'),
+        )
 
     def __str__(self):
         return self.name
@@ -175,3 +204,62 @@ class ShoppingList(models.Model):
         constraints = (
             models.UniqueConstraint(
                 fields=('user', 'recipe',), name='unique_basket'),)
+
+
+class ShoppingCartIngredient(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='пользователь',
+        related_name='shopping_cart_ingredients'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='ингредиент',
+        related_name='shopping_cart_ingredients'
+    )
+    amount = models.PositiveIntegerField(verbose_name='количество')
+
+    class Meta:
+        verbose_name = 'ингредиент в списке покупок'
+        verbose_name_plural = 'ингредиенты в списках покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'), name='unique_cart_ingredient'),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient} {self.amount}'
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='рецепт',
+        related_name='similar_recipes'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='похожий рецепт',
+        related_name='similar_to'
+    )
+    score = models.FloatField(verbose_name='сходство')
+
+    class Meta:
+        verbose_name = 'похожий рецепт'
+        verbose_name_plural = 'похожие рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'), name='unique_similar_recipe'),
+        )
+        indexes = (
+            models.Index(
+                fields=('recipe', '-score'),
+                name='similar_recipe_score_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar} ({self.score:.2f})'
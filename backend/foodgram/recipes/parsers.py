@@ -0,0 +1,57 @@
+import json
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import DataAndFiles, JSONParser, MultiPartParser
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'payload_too_large'
+
+
+class RecipeJSONParser(JSONParser):
+    """JSON, размер которого проверяется по заголовку до чтения тела."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        length = request.META.get('CONTENT_LENGTH') or 0
+        if int(length) > settings.RECIPE_MAX_BODY_SIZE:
+            raise PayloadTooLarge()
+        return super().parse(stream, media_type, parser_context)
+
+
+class RecipeMultiPartParser(MultiPartParser):
+    """Рецепт формой: картинка файлом, ингредиенты строкой JSON.
+
+    Файл Django пишет на диск частями, поэтому картинка не попадает
+    в память целиком и не кодируется в base64.
+    """
+
+    json_fields = ('ingredients',)
+    list_fields = ('tags',)
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parsed = super().parse(stream, media_type, parser_context)
+        data = {}
+        for key, values in parsed.data.lists():
+            if key in self.json_fields:
+                try:
+                    data[key] = json.loads(values[-1])
+                except ValueError as error:
+                    raise ParseError(f'{key}: {error}')
+            elif key in self.list_fields:
+                data[key] = self.parse_list(values)
+            else:
+                data[key] = values[-1]
+        return DataAndFiles(data, parsed.files.dict())
+
+    def parse_list(self, values):
+        if len(values) == 1 and values[0].startswith('['):
+            try:
+                return json.loads(values[0])
+            except ValueError as error:
+                raise ParseError(str(error))
+        return values
@@ -0,0 +1,354 @@
+import bisect
+import re
+import time
+from array import array
+from collections import Counter, defaultdict
+from threading import Lock, local
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from recipes.models import Ingredient, IngredientsInRecipe
+
+FUZZY_MIN_LENGTH = 3
+WORD = re.compile(r'\w+')
+
+
+def normalize(text):
+    return text.strip().lower().replace('ё', 'е')
+
+
+def fuzzy_prefix_search(query, keys, max_distance):
+    """Ищет в отсортированном списке keys названия с опечатками.
+
+    Для каждого ключа считается расстояние Левенштейна от query до
+    ближайшего префикса ключа. Строки таблицы переиспользуются для общего
+    префикса соседних ключей, а безнадёжные префиксы пропускаются целиком
+    бинарным поиском, так что просмотр ведётся как обход префиксного
+    дерева. Возвращает пары (расстояние, позиция ключа).
+    """
+    width = len(query) + max_distance
+    rows = [list(range(len(query) + 1))]
+    bests = [rows[0][-1]]
+    previous = ''
+    found = []
+    position = 0
+    while position < len(keys):
+        key = keys[position][:width]
+        common = 0
+        limit = min(len(previous), len(key))
+        while common < limit and previous[common] == key[common]:
+            common += 1
+        del rows[common + 1:]
+        del bests[common + 1:]
+        pruned = False
+        for char in key[common:]:
+            above = rows[-1]
+            row = [above[0] + 1]
+            for i, query_char in enumerate(query, start=1):
+                row.append(min(
+                    above[i] + 1,
+                    row[i - 1] + 1,
+                    above[i - 1] + (query_char != char),
+                ))
+            rows.append(row)
+            bests.append(min(bests[-1], row[-1]))
+            if min(row) > max_distance:
+                pruned = True
+                break
+        previous = key[:len(rows) - 1]
+        best = bests[-1]
+        if pruned or len(previous) == width:
+            end = bisect.bisect_left(keys, previous + '\uffff', position)
+        else:
+            end = position + 1
+        if best <= max_distance:
+            found.extend((best, index) for index in range(position, end))
+        position = end
+    return found
+
+
+class IngredientIndex:
+    """Отсортированный по названию индекс ингредиентов в памяти процесса.
+
+    Поиск по префиксу делается бинарным поиском, а если ничего не нашлось,
+    подбираются названия с опечатками. Индекс строится при первом запросе
+    и сбрасывается сигналами при изменении ингредиентов, а в соседних
+    процессах устаревает через INGREDIENT_INDEX_TTL секунд.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._keys = None
+        self._items = None
+        self._fuzzy_cache = {}
+        self._built_at = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+            self._items = None
+            self._fuzzy_cache = {}
+
+    def _get(self):
+        with self._lock:
+            expired = (
+                time.monotonic() - self._built_at
+                > settings.INGREDIENT_INDEX_TTL
+            )
+            if self._keys is None or expired:
+                items = sorted(
+                    Ingredient.objects.values(
+                        'id', 'name', 'measurement_unit'),
+                    key=lambda item: (normalize(item['name']), item['id'])
+                )
+                self._keys = [normalize(item['name']) for item in items]
+                self._items = items
+                self._fuzzy_cache = {}
+                self._built_at = time.monotonic()
+            return self._keys, self._items
+
+    def all(self):
+        return self._get()[1]
+
+    def search(self, query, limit=None):
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        query = normalize(query)
+        keys, items = self._get()
+        start = bisect.bisect_left(keys, query)
+        end = bisect.bisect_left(keys, query + '\uffff', start)
+        if start < end:
+            return items[start:min(end, start + limit)]
+        if len(query) < FUZZY_MIN_LENGTH:
+            return []
+        return self._fuzzy(query, keys, items)[:limit]
+
+    def _fuzzy(self, query, keys, items):
+        if query in self._fuzzy_cache:
+            return self._fuzzy_cache[query]
+        max_distance = 1 if len(query) <= 5 else 2
+        scored = sorted(fuzzy_prefix_search(query, keys, max_distance))
+        found = [items[position] for distance, position in scored]
+        if len(self._fuzzy_cache) < settings.INGREDIENT_SEARCH_CACHE_SIZE:
+            self._fuzzy_cache[query] = found
+        return found
+
+
+ingredient_index = IngredientIndex()
+
+
+class RefreshBatch:
+    """Отложенный до коммита refresh рецептов одной транзакции."""
+
+    def __init__(self, index):
+        self.index = index
+        self.recipe_ids = set()
+
+    def __call__(self):
+        self.index.refresh(self.recipe_ids)
+
+
+class RecipeIngredientIndex:
+    """Обратный индекс ингредиент -> рецепты в памяти процесса.
+
+    Списки рецептов хранятся отсортированными массивами array('I'), по
+    4 байта на пару. Совпадения считаются проходом по спискам имеющихся
+    ингредиентов, поэтому запрос стоит столько, сколько рецептов с ними
+    связано, и не зависит от числа рецептов в базе. Изменённые рецепты
+    сигналы обновляют точечно методом refresh, а в соседних процессах
+    индекс устаревает через RECIPE_INGREDIENT_INDEX_TTL.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._postings = None
+        self._recipes = None
+        self._built_at = 0
+        self._pending = local()
+
+    def invalidate(self):
+        with self._lock:
+            self._postings = None
+            self._recipes = None
+
+    def refresh(self, recipe_ids):
+        """Перечитывает из базы ингредиенты рецептов recipe_ids; удалённые
+        рецепты пропадают из индекса."""
+        with self._lock:
+            if self._postings is None:
+                return
+            current = defaultdict(list)
+            rows = IngredientsInRecipe.objects.filter(
+                recipe_id__in=recipe_ids).values_list(
+                'recipe_id', 'ingredient_id')
+            for recipe_id, ingredient_id in rows:
+                current[recipe_id].append(ingredient_id)
+            # search читает списки без блокировки, поэтому изменённые
+            # списки собираются заново и подменяются целиком
+            changed = {}
+            for recipe_id in recipe_ids:
+                for ingredient_id in self._recipes.pop(recipe_id, ()):
+                    posting = changed.setdefault(ingredient_id, array(
+                        'I', self._postings.get(ingredient_id, ())))
+                    position = bisect.bisect_left(posting, recipe_id)
+                    if (position < len(posting)
+                            and posting[position] == recipe_id):
+                        del posting[position]
+                ingredient_ids = current.get(recipe_id)
+                if not ingredient_ids:
+                    continue
+                self._recipes[recipe_id] = tuple(ingredient_ids)
+                for ingredient_id in ingredient_ids:
+                    posting = changed.setdefault(ingredient_id, array(
+                        'I', self._postings.get(ingredient_id, ())))
+                    bisect.insort(posting, recipe_id)
+            self._postings.update(changed)
+
+    def refresh_on_commit(self, recipe_id):
+        """Обновляет рецепт после фиксации транзакции. Все рецепты одной
+        транзакции перечитываются одним вызовом refresh."""
+        batch = getattr(self._pending, 'batch', None)
+        if batch is None or not any(
+                hook is batch for _, hook in connection.run_on_commit):
+            batch = self._pending.batch = RefreshBatch(self)
+            batch.recipe_ids.add(recipe_id)
+            transaction.on_commit(batch)
+        else:
+            batch.recipe_ids.add(recipe_id)
+
+    def _get(self):
+        with self._lock:
+            expired = (
+                time.monotonic() - self._built_at
+                > settings.RECIPE_INGREDIENT_INDEX_TTL
+            )
+            if self._postings is None or expired:
+                postings = defaultdict(lambda: array('I'))
+                recipes = defaultdict(list)
+                rows = IngredientsInRecipe.objects.order_by(
+                    'ingredient_id', 'recipe_id').values_list(
+                    'ingredient_id', 'recipe_id')
+                for ingredient_id, recipe_id in rows.iterator():
+                    postings[ingredient_id].append(recipe_id)
+                    recipes[recipe_id].append(ingredient_id)
+                self._postings = dict(postings)
+                self._recipes = {
+                    recipe_id: tuple(ingredient_ids)
+                    for recipe_id, ingredient_ids in recipes.items()
+                }
+                self._built_at = time.monotonic()
+            return self._postings, self._recipes
+
+    def search(self, ingredient_ids, max_missing=0):
+        """[(recipe_id, недостающих)] рецептов, где не хватает не больше
+        max_missing ингредиентов: сначала полные, потом по числу
+        совпадений и от новых к старым."""
+        postings, recipes = self._get()
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(postings.get(ingredient_id, ()))
+        found = []
+        for recipe_id, count in matched.items():
+            # рецепт мог удалить параллельный refresh
+            missing = len(recipes.get(recipe_id, ())) - count
+            if 0 <= missing <= max_missing:
+                found.append((missing, -count, -recipe_id))
+        found.sort()
+        return [(-recipe_id, missing) for missing, _, recipe_id in found]
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
+
+
+# те же триггеры, что в миграции 0010: SQLite теряет их, когда миграция
+# пересоздаёт таблицу recipes_recipe
+SQLITE_TRIGGERS = {
+    'recipes_recipe_fts_insert': '''
+    CREATE TRIGGER recipes_recipe_fts_insert AFTER INSERT ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    ''',
+    'recipes_recipe_fts_delete': '''
+    CREATE TRIGGER recipes_recipe_fts_delete AFTER DELETE ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    ''',
+    'recipes_recipe_fts_update': '''
+    CREATE TRIGGER recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO recipes_recipe_fts (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    ''',
+}
+
+
+def restore_search_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Обработчик post_migrate: на SQLite заново создаёт пропавшие триггеры
+    FTS5 и перестраивает индекс, пропустивший изменения без них."""
+    database = connections[using]
+    if database.vendor != 'sqlite':
+        return
+    with database.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"
+            " AND name LIKE 'recipes_recipe_fts%'")
+        existing = {name for name, in cursor.fetchall()}
+        if 'recipes_recipe_fts' not in existing:
+            return
+        missing = [
+            sql for name, sql in SQLITE_TRIGGERS.items()
+            if name not in existing
+        ]
+        for sql in missing:
+            cursor.execute(sql)
+        if missing:
+            cursor.execute(
+                "INSERT INTO recipes_recipe_fts (recipes_recipe_fts) "
+                "VALUES ('rebuild')")
+
+
+def fts5_query(query):
+    """Слова запроса в кавычках и с * на конце: FTS5 ищет все слова по
+    префиксу, а спецсимволы его синтаксиса из запроса не попадают."""
+    return ' '.join(f'"{word}"*' for word in WORD.findall(query.lower()))
+
+
+def search_recipes(queryset, query):
+    """Полнотекстовый поиск по названию и описанию рецепта.
+
+    На PostgreSQL ищет по столбцу search_vector с GIN-индексом и русской
+    морфологией, на SQLite — по таблице FTS5. Оба поддерживаются
+    триггерами из миграции 0010. Результаты упорядочены по релевантности,
+    название весит больше описания.
+    """
+    if not WORD.search(query):
+        return queryset.none()
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        tsquery = "plainto_tsquery('russian', %s)"
+        return queryset.extra(
+            where=[f'recipes_recipe.search_vector @@ {tsquery}'],
+            params=[query],
+        ).annotate(search_rank=RawSQL(
+            f'ts_rank(recipes_recipe.search_vector, {tsquery})',
+            (query,), output_field=FloatField()
+        )).order_by('-search_rank', '-pub_date', '-id')
+    if vendor == 'sqlite':
+        return queryset.extra(
+            tables=['recipes_recipe_fts'],
+            where=['recipes_recipe_fts.rowid = recipes_recipe.id',
+                   'recipes_recipe_fts MATCH %s'],
+            params=[fts5_query(query)],
+            select={'search_rank': '-bm25(recipes_recipe_fts, 10.0, 1.0)'},
+        ).order_by('-search_rank', '-pub_date', '-id')
+    return queryset.filter(Q(name__icontains=query) | Q(text__icontains=query))
@@ -1,13 +1,19 @@
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
-from drf_extra_fields.fields import Base64ImageField
+from django.db import transaction
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from rest_framework import serializers
 from users.serializers import CustomUserSerializer
 from rest_framework.validators import UniqueTogetherValidator
 
 from foodgram.settings import MIN_VALUE_AMOUNT, MIN_VALUE_COOKING_TIME
+from recipes.fields import BoundedImageField, RenditionsField
+from recipes.flags import get_user_flags
+from recipes.images import schedule_renditions
 from recipes.models import (BestRecipes, Ingredient, IngredientsInRecipe,
                             Recipe, ShoppingList, Tag)
+from recipes.search import recipe_ingredient_index
+from recipes.shopping_cart import apply_cart_changes, get_cart_users
+from recipes.similarity import update_similar_on_commit
 
 User = get_user_model()
 
@@ -43,6 +49,16 @@ class IngtedientsInRecipe(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        flags = get_user_flags(self.context)
+        flags.load_recipes(recipe.id for recipe in recipes)
+        flags.load_authors(recipe.author_id for recipe in recipes)
+        return super().to_representation(recipes)
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     ingredients = IngredientListSerializer(
@@ -52,30 +68,22 @@ class RecipeSerializer(serializers.ModelSerializer):
         read_only=True, method_name='get_is_in_shopping_cart')
     is_favorited = serializers.SerializerMethodField(
         read_only=True, method_name='get_is_favorited')
+    renditions = RenditionsField()
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return ShoppingList.objects.filter(
-            recipe_id=obj, user=request.user
-        ).exists()
+        return get_user_flags(self.context).is_in_shopping_cart(obj)
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return BestRecipes.objects.filter(
-            recipe_id=obj, user=request.user
-        ).exists()
+        return get_user_flags(self.context).is_favorited(obj)
 
     class Meta:
         model = Recipe
         fields = '__all__'
+        list_serializer_class = RecipeListSerializer
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = BoundedImageField(max_length=None, use_url=True)
     name = serializers.CharField(required=False)
     ingredients = IngredientListSerializer(
         many=True, source='ingredients_amount')
@@ -83,15 +91,23 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
 
     def validate_ingredients(self, data):
-        ingredients = self.initial_data.get('ingredients')
-        if ingredients == []:
+        if not data:
             raise serializers.ValidationError(
                 f'выберите хотя бы {MIN_VALUE_AMOUNT} ингредиент')
-        for ingredient in ingredients:
+        amounts = {}
+        for ingredient in data:
             if int(ingredient['amount']) < MIN_VALUE_AMOUNT:
                 raise serializers.ValidationError(
                     f'количество не может быть меньше {MIN_VALUE_AMOUNT}')
-        return data
+            ingredient_id = ingredient['ingredient']['id']
+            amounts[ingredient_id] = (
+                amounts.get(ingredient_id, 0) + ingredient['amount'])
+        missing = set(amounts) - set(Ingredient.objects.in_bulk(amounts))
+        if missing:
+            raise serializers.ValidationError(
+                'ингредиенты не найдены: '
+                f'{", ".join(map(str, sorted(missing)))}')
+        return amounts
 
     def validate_cooking_time(self, data):
         if int(data) < MIN_VALUE_COOKING_TIME:
@@ -100,56 +116,86 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 f'не может быть меньше {MIN_VALUE_COOKING_TIME}')
         return data
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
+    @transaction.atomic
     def create(self, validated_data):
-        validated_data.pop('ingredients_amount')
+        amounts = validated_data.pop('ingredients_amount')
         tags = validated_data.pop('tags')
         recipe = super().create(validated_data)
-        ingredients_amount = self.update_ingredients_list(
-            self.initial_data['ingredients'], recipe)
         recipe.tags.set(tags)
-        recipe.ingredients_amount.set(ingredients_amount)
-        recipe.save()
+        self.set_ingredients(recipe, amounts, created=True)
+        schedule_renditions(recipe.image.name)
+        update_similar_on_commit(recipe.id)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get('cooking_time',
-                                                   instance.cooking_time)
-        instance.image = validated_data.get('image', instance.image)
-        ingredients_data = validated_data.pop('ingredients_amount', None)
-        tags_data = validated_data.pop('tags', None)
-        if tags_data:
-            instance.tags.set(tags_data)
-        if ingredients_data:
-            ing = self.initial_data['ingredients']
-            ingredients = self.update_ingredients_list(
-                ing,
-                instance)
-            instance.ingredients_amount.set(ingredients)
-        instance.save()
+        amounts = validated_data.pop('ingredients_amount', None)
+        tags = validated_data.pop('tags', None)
+        if tags:
+            instance.tags.set(tags)
+        if amounts:
+            self.set_ingredients(instance, amounts)
+        if tags or amounts:
+            update_similar_on_commit(instance.id)
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            schedule_renditions(instance.image.name)
         return instance
 
-    def update_ingredients_list(self, ingredients, recipe_id):
-        ingredients_list = []
-        ingredients_to_del = IngredientsInRecipe.objects.filter(
-            recipe=recipe_id)
-        if ingredients_to_del:
-            for ing in ingredients_to_del:
-                ing.delete()
-        for ing in ingredients:
-            ingredient_id = ing['id']
-            amount = ing['amount']
-            ingredient_instance = get_object_or_404(
-                Ingredient, id=ingredient_id)
-            if (IngredientsInRecipe.objects.
-               filter(recipe=recipe_id, ingredient_id=ingredient_id).exists()):
-                amount += ('amount')
-            ing, updated = IngredientsInRecipe.objects.update_or_create(
-                recipe=recipe_id, ingredient=ingredient_instance,
-                defaults={'amount': amount})
-            ingredients_list.append(ing)
-        return ingredients_list
+    def to_representation(self, instance):
+        prefetch_related_objects(
+            (instance,),
+            'tags',
+            Prefetch(
+                'ingredients_amount',
+                queryset=IngredientsInRecipe.objects.select_related(
+                    'ingredient')
+            ),
+        )
+        return RecipeSerializer(instance, context=self.context).data
+
+    def set_ingredients(self, recipe, amounts, created=False):
+        current = {} if created else {
+            row.ingredient_id: row for row in recipe.ingredients_amount.all()
+        }
+        to_create = [
+            IngredientsInRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ]
+        deltas = {
+            ingredient_id: amounts.get(ingredient_id, 0) - (
+                current[ingredient_id].amount if ingredient_id in current
+                else 0)
+            for ingredient_id in set(amounts) | set(current)
+        }
+        to_update = []
+        to_delete = []
+        for ingredient_id, row in current.items():
+            if ingredient_id not in amounts:
+                to_delete.append(row.id)
+            elif row.amount != amounts[ingredient_id]:
+                row.amount = amounts[ingredient_id]
+                to_update.append(row)
+        if to_delete:
+            IngredientsInRecipe.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            IngredientsInRecipe.objects.bulk_update(to_update, ('amount',))
+        if to_create:
+            # bulk_create не шлёт post_save, индекс обновляется здесь
+            IngredientsInRecipe.objects.bulk_create(to_create)
+            recipe_ingredient_index.refresh_on_commit(recipe.id)
+        if not created:
+            apply_cart_changes(get_cart_users(recipe.id), deltas)
 
     class Meta:
         model = Recipe
@@ -157,10 +203,11 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
 
 class ShortSerializer(serializers.ModelSerializer):
+    renditions = RenditionsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'renditions', 'cooking_time')
 
 
 class BestRecipesSerializer(serializers.ModelSerializer):
@@ -206,9 +253,10 @@ class ShoppingListSerializer(serializers.ModelSerializer):
 class RecipeSubscribeSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField()
     name = serializers.CharField()
-    image = Base64ImageField()
+    image = serializers.ImageField(read_only=True)
+    renditions = RenditionsField()
     cooking_time = serializers.IntegerField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'renditions', 'cooking_time')
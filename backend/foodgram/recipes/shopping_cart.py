@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import (IngredientsInRecipe, ShoppingCartIngredient,
+                            ShoppingList)
+from users.models import User
+
+
+def get_recipe_amounts(recipe_id):
+    return dict(IngredientsInRecipe.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount'))
+
+
+def get_cart_users(recipe_id):
+    return list(ShoppingList.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True))
+
+
+@transaction.atomic
+def apply_cart_changes(user_ids, deltas):
+    """Прибавляет deltas {ingredient_id: количество} к спискам покупок."""
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    if not user_ids or not deltas:
+        return
+    # select_for_update ниже блокирует только существующие строки: две
+    # параллельные транзакции добавили бы один и тот же новый ингредиент
+    # и столкнулись на unique_cart_ingredient. Поэтому сначала по порядку
+    # id блокируются сами пользователи
+    list(User.objects.select_for_update().filter(
+        pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+    existing = {
+        (row.user_id, row.ingredient_id): row
+        for row in ShoppingCartIngredient.objects.select_for_update().filter(
+            user_id__in=user_ids, ingredient_id__in=deltas)
+    }
+    to_create = []
+    to_update = []
+    to_delete = []
+    for user_id in user_ids:
+        for ingredient_id, delta in deltas.items():
+            row = existing.get((user_id, ingredient_id))
+            if row is None:
+                if delta > 0:
+                    to_create.append(ShoppingCartIngredient(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        amount=delta))
+            elif row.amount + delta > 0:
+                row.amount += delta
+                to_update.append(row)
+            else:
+                to_delete.append(row.id)
+    if to_delete:
+        ShoppingCartIngredient.objects.filter(id__in=to_delete).delete()
+    if to_update:
+        ShoppingCartIngredient.objects.bulk_update(to_update, ('amount',))
+    if to_create:
+        ShoppingCartIngredient.objects.bulk_create(to_create)
+
+
+@transaction.atomic
+def rebuild_carts(user_ids=None):
+    """Пересобирает списки покупок из IngredientsInRecipe с нуля."""
+    carts = ShoppingCartIngredient.objects.all()
+    rows = IngredientsInRecipe.objects.filter(recipe__basket__isnull=False)
+    if user_ids is not None:
+        carts = carts.filter(user_id__in=user_ids)
+        rows = IngredientsInRecipe.objects.filter(
+            recipe__basket__user_id__in=user_ids)
+    totals = rows.values_list(
+        'recipe__basket__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by()
+    carts.delete()
+    ShoppingCartIngredient.objects.bulk_create(
+        ShoppingCartIngredient(
+            user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+        for user_id, ingredient_id, amount in totals.iterator()
+    )
@@ -0,0 +1,102 @@
+import csv
+import hashlib
+import io
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingCartIngredient
+
+FONT_NAME = 'DejaVuSans'
+TITLE = 'Список ингредиентов'
+TITLE_SIZE = 24
+LINE_SIZE = 16
+LINE_HEIGHT = 25
+MARGIN = 50
+
+
+def register_fonts():
+    pdfmetrics.registerFont(TTFont(FONT_NAME, settings.PDF_FONT_PATH))
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def get_shopping_cart(user):
+    return ShoppingCartIngredient.objects.filter(user=user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by('ingredient__name')
+
+
+def render_pdf(ingredients):
+    buffer = io.BytesIO()
+    width, height = A4
+    page = canvas.Canvas(buffer, pagesize=A4)
+    page.setFont(FONT_NAME, size=TITLE_SIZE)
+    page.drawString(MARGIN, height - MARGIN - TITLE_SIZE, TITLE)
+    y = height - MARGIN - TITLE_SIZE - 2 * LINE_HEIGHT
+    page.setFont(FONT_NAME, size=LINE_SIZE)
+    for i, (name, unit, amount) in enumerate(ingredients, start=1):
+        if y < MARGIN:
+            page.showPage()
+            page.setFont(FONT_NAME, size=LINE_SIZE)
+            y = height - MARGIN - LINE_SIZE
+        page.drawString(MARGIN + 25, y, f'{i}. {name}  {amount} {unit}.')
+        y -= LINE_HEIGHT
+    page.showPage()
+    page.save()
+    return buffer.getvalue()
+
+
+def render_shopping_list(ingredients):
+    digest = hashlib.sha256(
+        json.dumps(ingredients, ensure_ascii=False).encode()
+    ).hexdigest()
+    key = f'shopping_list:pdf:{digest}'
+    content = cache.get(key)
+    if content is None:
+        content = render_pdf(ingredients)
+        cache.set(key, content, settings.SHOPPING_LIST_CACHE_TIMEOUT)
+    return content
+
+
+def iter_text(ingredients):
+    yield f'{TITLE}\n\n'
+    for i, (name, unit, amount) in enumerate(ingredients, start=1):
+        yield f'{i}. {name}  {amount} {unit}.\n'
+
+
+def iter_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in ingredients:
+        yield writer.writerow(row)
+
+
+def iter_json(ingredients):
+    yield '['
+    for i, (name, unit, amount) in enumerate(ingredients):
+        yield ('{}{}'.format(',' if i else '', json.dumps(
+            {'name': name, 'measurement_unit': unit, 'amount': amount},
+            ensure_ascii=False)))
+    yield ']'
+
+
+EXPORTERS = {
+    'txt': iter_text,
+    'csv': iter_csv,
+    'json': iter_json,
+}
+
+
+def iter_chunks(content, chunk_size=None):
+    chunk_size = chunk_size or settings.SHOPPING_LIST_CHUNK_SIZE
+    for start in range(0, len(content), chunk_size):
+        yield content[start:start + chunk_size]
@@ -0,0 +1,149 @@
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from recipes.cache import bump_generation_on_commit, user_generation_name
+from recipes.models import (BestRecipes, Ingredient, IngredientsInRecipe,
+                            Recipe, ShoppingList, Tag)
+from recipes.search import ingredient_index, recipe_ingredient_index
+from recipes.shopping_cart import (apply_cart_changes, get_cart_users,
+                                   get_recipe_amounts)
+from users.models import User
+
+
+_deleting = threading.local()
+
+
+def change_counter(model, pk, field, delta):
+    model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+def being_deleted(model):
+    """id объектов model, удаление которых сейчас идёт в этом потоке.
+
+    Collector рассылает все pre_delete до первого post_delete, поэтому
+    метка, поставленная в pre_delete рецепта или пользователя, видна
+    обработчикам post_delete всех строк каскада. Такие строки не трогают
+    счётчики удаляемого объекта, а общие изменения делает один раз
+    обработчик pre_delete. Метка снимается в post_delete самого объекта.
+    """
+    marks = getattr(_deleting, 'marks', None)
+    if marks is None:
+        marks = _deleting.marks = defaultdict(set)
+    return marks[model]
+
+
+def negate(amounts):
+    return {
+        ingredient_id: -amount for ingredient_id, amount in amounts.items()}
+
+
+def cascade_handled(instance):
+    """Строка избранного или корзины удаляется каскадом рецепта или
+    пользователя, и её изменения уже учтены одним запросом."""
+    return (instance.recipe_id in being_deleted(Recipe)
+            or instance.user_id in being_deleted(User))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    being_deleted(Recipe).add(instance.pk)
+    cart_user_ids = get_cart_users(instance.pk)
+    apply_cart_changes(cart_user_ids, negate(get_recipe_amounts(instance.pk)))
+    recipe_ingredient_index.refresh_on_commit(instance.pk)
+    user_ids = set(BestRecipes.objects.filter(
+        recipe_id=instance.pk).values_list('user_id', flat=True))
+    user_ids.update(cart_user_ids)
+    if user_ids:
+        bump_generation_on_commit(
+            'counters', *map(user_generation_name, user_ids))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    being_deleted(Recipe).discard(instance.pk)
+    if instance.author_id not in being_deleted(User):
+        change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=BestRecipes)
+def favorite_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=BestRecipes)
+def favorite_deleted(sender, instance, **kwargs):
+    if not cascade_handled(instance):
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingList)
+def shopping_cart_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'shopping_cart_count', 1)
+        apply_cart_changes(
+            (instance.user_id,), get_recipe_amounts(instance.recipe_id))
+
+
+@receiver(post_delete, sender=ShoppingList)
+def shopping_cart_deleted(sender, instance, **kwargs):
+    if cascade_handled(instance):
+        return
+    change_counter(Recipe, instance.recipe_id, 'shopping_cart_count', -1)
+    apply_cart_changes(
+        (instance.user_id,), negate(get_recipe_amounts(instance.recipe_id)))
+
+
+@receiver(post_save, sender=BestRecipes)
+@receiver(post_delete, sender=BestRecipes)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_delete, sender=ShoppingList)
+def user_recipes_changed(sender, instance, signal, **kwargs):
+    if signal is post_delete and cascade_handled(instance):
+        return
+    bump_generation_on_commit(
+        'counters', user_generation_name(instance.user_id))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    # до коммита соседний запрос перестроил бы индекс по старым данным
+    transaction.on_commit(ingredient_index.invalidate)
+    bump_generation_on_commit('ingredients', 'recipes')
+
+
+@receiver(post_save, sender=IngredientsInRecipe)
+@receiver(post_delete, sender=IngredientsInRecipe)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    # рецепт, удаляемый каскадом, обновляет индекс один раз в recipe_deleting
+    if instance.recipe_id not in being_deleted(Recipe):
+        recipe_ingredient_index.refresh_on_commit(instance.recipe_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_generation_on_commit('tags', 'recipes')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientsInRecipe)
+@receiver(post_delete, sender=IngredientsInRecipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_changed(sender, action='post', **kwargs):
+    if action.startswith('post'):
+        bump_generation_on_commit('recipes')
@@ -0,0 +1,262 @@
+import heapq
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+
+from recipes.models import IngredientsInRecipe, Recipe, SimilarRecipe
+
+
+NO_TAGS = frozenset()
+# Списки короче этого просматриваются всегда, чтобы на маленькой базе
+# доля SIMILAR_RECIPES_MAX_DF не отрезала все общие ингредиенты.
+MAX_DF_FLOOR = 1000
+
+
+def max_df(total):
+    return max(MAX_DF_FLOOR, settings.SIMILAR_RECIPES_MAX_DF * total)
+
+
+def load_graph():
+    """Ингредиенты и теги всех рецептов: два запроса без JOIN."""
+    ingredients = defaultdict(set)
+    for recipe_id, ingredient_id in IngredientsInRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id').iterator():
+        ingredients[recipe_id].add(ingredient_id)
+    tags = defaultdict(set)
+    for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag_id').iterator():
+        tags[recipe_id].add(tag_id)
+    return ingredients, tags
+
+
+def jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+class SimilarityIndex:
+    """Разреженные TF-IDF векторы рецептов по ингредиентам.
+
+    Вместо матрицы хранится обратный индекс ингредиент -> рецепты:
+    скалярные произведения считаются только с рецептами, у которых есть
+    общие ингредиенты. Самые частые ингредиенты (соль, вода), которые
+    встречаются больше чем в SIMILAR_RECIPES_MAX_DF доле рецептов, при
+    подборе кандидатов пропускаются: вес IDF у них мал, а списки длинные.
+    """
+
+    def __init__(self, ingredients, tags, frequencies=None, total=None):
+        """Без frequencies и total индекс строится по всей базе; иначе
+        ingredients — подграф, а частоты ингредиентов и число рецептов
+        берутся по всей базе, чтобы веса совпали с полным расчётом."""
+        self.ingredients = ingredients
+        self.postings = defaultdict(list)
+        for recipe_id, ingredient_ids in ingredients.items():
+            for ingredient_id in ingredient_ids:
+                self.postings[ingredient_id].append(recipe_id)
+        if frequencies is None:
+            frequencies = {
+                ingredient_id: len(recipes)
+                for ingredient_id, recipes in self.postings.items()
+            }
+            total = len(ingredients)
+        self.frequencies = frequencies
+        self.max_df = max_df(total)
+        self.idf = {
+            ingredient_id: math.log(total / frequency)
+            for ingredient_id, frequency in frequencies.items()
+        }
+        # Нормы и наборы тегов лежат в списках по id рецепта: во
+        # внутреннем цикле индекс в списке заметно дешевле словаря.
+        size = max(ingredients, default=0) + 1
+        self.inverse_norms = [0.0] * size
+        for recipe_id, ingredient_ids in ingredients.items():
+            norm = math.sqrt(sum(
+                self.idf[ingredient_id] ** 2
+                for ingredient_id in ingredient_ids))
+            if norm:
+                self.inverse_norms[recipe_id] = 1 / norm
+        self.tag_sets = [NO_TAGS]
+        positions = {NO_TAGS: 0}
+        self.tag_set_of = [0] * size
+        for recipe_id, tag_ids in tags.items():
+            if recipe_id < size:
+                tag_set = frozenset(tag_ids)
+                if tag_set not in positions:
+                    positions[tag_set] = len(self.tag_sets)
+                    self.tag_sets.append(tag_set)
+                self.tag_set_of[recipe_id] = positions[tag_set]
+
+    def dot_products(self, recipe_id):
+        products = defaultdict(float)
+        for ingredient_id in self.ingredients.get(recipe_id, ()):
+            if self.frequencies[ingredient_id] > self.max_df:
+                continue
+            weight = self.idf[ingredient_id] ** 2
+            for other_id in self.postings[ingredient_id]:
+                products[other_id] += weight
+        products.pop(recipe_id, None)
+        return products
+
+    def scores(self, recipe_id):
+        """{recipe_id: сходство} со всеми рецептами, где оно не нулевое.
+
+        Различных наборов тегов немного, поэтому коэффициент Жаккара
+        считается один раз на набор, а не на каждого кандидата.
+        """
+        if recipe_id >= len(self.inverse_norms):
+            return {}
+        inverse_norm = self.inverse_norms[recipe_id]
+        if not inverse_norm:
+            return {}
+        tag_weight = settings.SIMILAR_RECIPES_TAG_WEIGHT
+        scale = (1 - tag_weight) * inverse_norm
+        tags = self.tag_sets[self.tag_set_of[recipe_id]]
+        tag_scores = [
+            tag_weight * jaccard(tags, other_tags)
+            for other_tags in self.tag_sets
+        ]
+        inverse_norms = self.inverse_norms
+        tag_set_of = self.tag_set_of
+        return {
+            other_id: (scale * product * inverse_norms[other_id]
+                       + tag_scores[tag_set_of[other_id]])
+            for other_id, product in self.dot_products(recipe_id).items()
+        }
+
+    def neighbours(self, recipe_id, top_k):
+        """[(score, recipe_id)] по убыванию сходства."""
+        return heapq.nlargest(top_k, (
+            (score, other_id)
+            for other_id, score in self.scores(recipe_id).items()
+        ))
+
+
+def rows_for(index, recipe_ids, top_k):
+    return [
+        SimilarRecipe(recipe_id=recipe_id, similar_id=other_id, score=score)
+        for recipe_id in recipe_ids
+        for score, other_id in index.neighbours(recipe_id, top_k)
+    ]
+
+
+def compute_similar(top_k=None):
+    """Пересчитывает похожие рецепты для всех рецептов."""
+    top_k = top_k or settings.SIMILAR_RECIPES_TOP_K
+    index = SimilarityIndex(*load_graph())
+    rows = rows_for(index, index.ingredients, top_k)
+    with transaction.atomic():
+        SimilarRecipe.objects.all().delete()
+        SimilarRecipe.objects.bulk_create(rows)
+    return len(rows)
+
+
+def load_neighbourhood(recipe_ids):
+    """Индекс по рецептам recipe_ids и их кандидатам в соседи.
+
+    Кандидаты — рецепты с общим ингредиентом не чаще max_df: только с
+    ними сходство не нулевое. Частоты ингредиентов подграфа считаются
+    одним агрегирующим запросом, вся таблица в память не читается.
+    Возвращает индекс и подзапрос с id кандидатов.
+    """
+    links = IngredientsInRecipe.objects.all()
+    total = Recipe.objects.count()
+    own = links.filter(recipe_id__in=recipe_ids).values('ingredient_id')
+    shared = links.filter(ingredient_id__in=own).values(
+        'ingredient_id').annotate(frequency=Count('id')).filter(
+        frequency__lte=max_df(total)).values('ingredient_id')
+    candidates = links.filter(ingredient_id__in=shared).values('recipe_id')
+    members = Q(recipe_id__in=candidates) | Q(recipe_id__in=recipe_ids)
+    ingredients = defaultdict(set)
+    for recipe_id, ingredient_id in links.filter(members).values_list(
+            'recipe_id', 'ingredient_id').iterator():
+        ingredients[recipe_id].add(ingredient_id)
+    frequencies = dict(links.filter(
+        ingredient_id__in=links.filter(members).values('ingredient_id')
+    ).values_list('ingredient_id').annotate(Count('id')).order_by())
+    tags = defaultdict(set)
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            members).values_list('recipe_id', 'tag_id').iterator():
+        tags[recipe_id].add(tag_id)
+    index = SimilarityIndex(ingredients, tags, frequencies, total)
+    return index, candidates
+
+
+def entering_rows(index, candidates, changed, top_k):
+    """Строки, которыми изменённые рецепты входят в чужие списки, и id
+    строк, которые они оттуда вытесняют.
+
+    Сходство между остальными рецептами не меняется, поэтому чужой
+    список достаточно слить с новыми оценками: пересчитывать его по
+    всей базе не нужно.
+    """
+    entering = defaultdict(list)
+    for recipe_id in changed:
+        for other_id, score in index.scores(recipe_id).items():
+            if other_id not in changed:
+                entering[other_id].append((score, recipe_id))
+    stored = SimilarRecipe.objects.exclude(
+        recipe_id__in=changed).exclude(similar_id__in=changed)
+    bounds = {
+        recipe_id: (count, lowest)
+        for recipe_id, count, lowest in stored.filter(
+            recipe_id__in=candidates).values_list('recipe_id').annotate(
+            Count('id'), Min('score')).order_by()
+    }
+    # сохранённый список читается, только если вместе с новыми оценками
+    # он длиннее top_k и хоть одна новая оценка может в него войти
+    overflowing = [
+        recipe_id for recipe_id, (count, lowest) in bounds.items()
+        if recipe_id in entering
+        and count + len(entering[recipe_id]) > top_k
+        and (count < top_k or max(entering[recipe_id])[0] > lowest)
+    ]
+    lists = defaultdict(list)
+    for row in stored.filter(recipe_id__in=overflowing):
+        lists[row.recipe_id].append((row.score, row.similar_id, row.id))
+    rows = []
+    evicted = []
+    for recipe_id, scores in entering.items():
+        count, lowest = bounds.get(recipe_id, (0, 0.0))
+        if count >= top_k and recipe_id not in lists:
+            continue
+        merged = heapq.nlargest(
+            top_k, lists[recipe_id] + [score + (None,) for score in scores])
+        kept = {row_id for _, _, row_id in merged}
+        evicted.extend(
+            row_id for _, _, row_id in lists[recipe_id]
+            if row_id not in kept)
+        rows.extend(
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for score, similar_id, row_id in merged if row_id is None)
+    return rows, evicted
+
+
+def update_similar(recipe_ids):
+    """Обновляет похожие рецепты после изменения recipe_ids.
+
+    Списки самих изменённых рецептов пересчитываются точно, в чужие
+    списки они вливаются по новым оценкам (entering_rows). Если
+    изменённый рецепт выпал из полного чужого списка, тот остаётся
+    короче top-K до ночного compute_similar_recipes: чтобы найти замену,
+    пришлось бы перебрать всех кандидатов того рецепта. Веса IDF тоже
+    уточняются только полным пересчётом.
+    """
+    top_k = settings.SIMILAR_RECIPES_TOP_K
+    changed = set(recipe_ids)
+    index, candidates = load_neighbourhood(changed)
+    rows, evicted = entering_rows(index, candidates, changed, top_k)
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(
+            Q(recipe_id__in=changed) | Q(similar_id__in=changed)
+            | Q(id__in=evicted)).delete()
+        SimilarRecipe.objects.bulk_create(
+            rows_for(index, changed, top_k) + rows)
+
+
+def update_similar_on_commit(recipe_id):
+    transaction.on_commit(lambda: update_similar((recipe_id,)))
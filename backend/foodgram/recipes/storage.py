@@ -0,0 +1,54 @@
+import hashlib
+import os
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файлы под именем из sha256 содержимого.
+
+    Одинаковые картинки занимают место на диске один раз: если файл
+    с таким хешем уже есть, запись пропускается, а время изменения
+    обновляется, чтобы collect_images не удалил файл, на который
+    ссылается ещё не зафиксированная транзакция.
+    """
+
+    directory = 'images'
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return f'{self.directory}/{digest[:2]}/{digest}{extension}'
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return super().save(
+            self.hashed_name(name, content), content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        # родительский _save, наткнувшись на файл, созданный параллельно
+        # той же картинкой, ловит FileExistsError сам и бесконечно повторяет
+        # запись под тем же именем из get_available_name. Поэтому пишем под
+        # уникальным временным именем и атомарно переименовываем: при гонке
+        # один одинаковый файл заменяет другой
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+recipe_image_storage = ContentAddressedStorage()
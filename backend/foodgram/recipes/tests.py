@@ -0,0 +1,1408 @@
+import base64
+import json
+import os
+import tempfile
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from foodgram.query_budget import (QueryBudgetExceeded, assert_query_budget,
+                                   get_view_budget, normalize_sql)
+from recipes import shopping_list
+from recipes.cache import get_generation, stats
+from recipes.images import make_renditions, rendition_names
+from recipes.models import (BestRecipes, Ingredient, IngredientsInRecipe,
+                            Recipe, ShoppingCartIngredient, ShoppingList,
+                            SimilarRecipe, Tag)
+from recipes.search import ingredient_index, recipe_ingredient_index
+from recipes.serializers import RecipeCreateSerializer
+from recipes.shopping_cart import apply_cart_changes
+from recipes.similarity import compute_similar, update_similar
+from recipes.views import RecipeViewSet, TagViewSet
+from users.models import Follow
+
+User = get_user_model()
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADE'
+    'lEQVR4nGNgYGAAAAAEAAH2FzhVAAAAAElFTkSuQmCC'
+)
+
+
+class RecipeQueriesTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.tags = [
+            Tag.objects.create(name=f'тэг {i}', color=f'#00000{i}',
+                               slug=f'tag{i}')
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(4)
+        ]
+
+    def create_recipes(self, count):
+        for i in range(count):
+            recipe = Recipe.objects.create(
+                name=f'рецепт {i}', author=self.author, image='recipe.png',
+                text='описание', cooking_time=10)
+            recipe.tags.set(self.tags)
+            IngredientsInRecipe.objects.bulk_create(
+                IngredientsInRecipe(recipe=recipe, ingredient=ingredient,
+                                    amount=5)
+                for ingredient in self.ingredients
+            )
+            BestRecipes.objects.create(user=self.user, recipe=recipe)
+            ShoppingList.objects.create(user=self.user, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_anonymous(self):
+        self.create_recipes(2)
+        with self.assertNumQueries(4):
+            self.client.get('/api/recipes/')
+        self.create_recipes(10)
+        cache.clear()
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertFalse(response.data['results'][0]['is_favorited'])
+
+    def test_list_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.create_recipes(2)
+        with self.assertNumQueries(7):
+            self.client.get('/api/recipes/')
+        self.create_recipes(10)
+        with self.assertNumQueries(7):
+            response = self.client.get('/api/recipes/')
+        recipe = response.data['results'][0]
+        self.assertTrue(recipe['is_favorited'])
+        self.assertTrue(recipe['is_in_shopping_cart'])
+        self.assertTrue(recipe['author']['is_subscribed'])
+        self.assertEqual(len(recipe['ingredients']), 4)
+        self.assertEqual(len(recipe['tags']), 3)
+
+    def test_cursor_pagination(self):
+        self.create_recipes(9)
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id').values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/recipes/', {'cursor': '', 'limit': 4})
+        self.assertFalse(
+            any('COUNT' in query['sql'] for query in queries.captured_queries))
+        ids = [recipe['id'] for recipe in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(ids, expected)
+        response = self.client.get('/api/recipes/', {'limit': 4, 'page': 3})
+        self.assertEqual(response.data['count'], 9)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_subscriptions_cursor(self):
+        self.client.force_authenticate(self.user)
+        for i in range(3):
+            author = User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='pass')
+            Follow.objects.create(user=self.user, author=author)
+        response = self.client.get(
+            '/api/users/subscriptions/', {'cursor': '', 'limit': 2})
+        usernames = [user['username'] for user in response.data['results']]
+        response = self.client.get(response.data['next'])
+        usernames += [user['username'] for user in response.data['results']]
+        self.assertEqual(
+            usernames, ['author2', 'author1', 'author0', 'author'])
+
+    def test_subscriptions_queries(self):
+        self.client.force_authenticate(self.user)
+        self.create_recipes(3)
+        with self.assertNumQueries(3):
+            self.client.get('/api/users/subscriptions/')
+        for i in range(5):
+            author = User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='pass')
+            Follow.objects.create(user=self.user, author=author)
+            for j in range(i):
+                Recipe.objects.create(
+                    name=f'рецепт {j}', author=author, image='recipe.png',
+                    text='описание', cooking_time=10)
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/users/subscriptions/', {'recipes_limit': 2})
+        recipes = {
+            author['username']: [recipe['id'] for recipe in author['recipes']]
+            for author in response.data['results']
+        }
+        for username, ids in recipes.items():
+            expected = Recipe.objects.filter(
+                author__username=username).order_by(
+                '-pub_date', '-id').values_list('id', flat=True)[:2]
+            self.assertEqual(ids, list(expected), username)
+        self.assertEqual(len(recipes['author4']), 2)
+        self.assertEqual(len(recipes['author0']), 0)
+        response = self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 0})
+        self.assertEqual(
+            {len(author['recipes']) for author in response.data['results']
+             if author['username'] == 'author4'}, {4})
+        self.assertTrue(
+            response.data['results'][0]['recipes'][0]['image'].startswith(
+                'http://'))
+
+    def test_feed(self):
+        self.client.force_authenticate(self.user)
+        self.create_recipes(3)
+        stranger = User.objects.create_user(
+            username='stranger', email='stranger@example.com',
+            password='pass')
+        Recipe.objects.create(
+            name='чужой', author=stranger, image='recipe.png',
+            text='описание', cooking_time=10)
+        with self.assertNumQueries(6):
+            self.client.get('/api/recipes/feed/')
+        for i in range(10):
+            author = User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='pass')
+            Follow.objects.create(user=self.user, author=author)
+            Recipe.objects.create(
+                name=f'рецепт {i}', author=author, image='recipe.png',
+                text='описание', cooking_time=10)
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/recipes/feed/', {'limit': 5})
+        ids = [recipe['id'] for recipe in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(ids, list(Recipe.objects.exclude(
+            author=stranger).order_by('-pub_date', '-id').values_list(
+            'id', flat=True)))
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_detail(self):
+        self.create_recipes(1)
+        recipe = Recipe.objects.get()
+        with self.assertNumQueries(4):
+            self.client.get(f'/api/recipes/{recipe.id}/')
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(7):
+            response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertTrue(response.data['is_favorited'])
+        self.assertTrue(response.data['author']['is_subscribed'])
+
+    def test_users_list(self):
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/users/')
+        subscribed = {
+            user['username']: user['is_subscribed']
+            for user in response.data['results']
+        }
+        self.assertEqual(subscribed, {'reader': False, 'author': True})
+
+
+class CountersTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+
+    def test_counters_follow_writes(self):
+        recipe = Recipe.objects.create(
+            name='рецепт', author=self.author, image='recipe.png',
+            text='описание', cooking_time=10)
+        BestRecipes.objects.create(user=self.user, recipe=recipe)
+        ShoppingList.objects.create(user=self.user, recipe=recipe)
+        Follow.objects.create(user=self.user, author=self.author)
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.shopping_cart_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.author.followers_count, 1)
+        BestRecipes.objects.all().delete()
+        recipe.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+    def assert_counters_consistent(self):
+        out = StringIO()
+        call_command('recount_counters', '--check', stdout=out)
+        self.assertIn('счётчики в порядке', out.getvalue())
+
+    def test_cascades_skip_deleted_targets(self):
+        author = User.objects.create_user(
+            username='chef', email='chef@example.com', password='pass')
+        readers = [
+            User.objects.create_user(
+                username=f'reader{i}', email=f'reader{i}@example.com',
+                password='pass')
+            for i in range(6)
+        ]
+        recipes = [
+            Recipe.objects.create(
+                name=f'рецепт {i}', author=author, image='recipe.png',
+                text='описание', cooking_time=10)
+            for i in range(2)
+        ]
+        for reader in readers:
+            Follow.objects.create(user=reader, author=author)
+            Follow.objects.create(user=author, author=reader)
+            for recipe in recipes:
+                BestRecipes.objects.create(user=reader, recipe=recipe)
+                ShoppingList.objects.create(user=reader, recipe=recipe)
+        with CaptureQueriesContext(connection) as captured:
+            recipes[0].delete()
+        updates = [
+            query['sql'] for query in captured.captured_queries
+            if query['sql'].startswith('UPDATE')
+            and '_count' in query['sql']
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assert_counters_consistent()
+        BestRecipes.objects.create(user=author, recipe=recipes[1])
+        with CaptureQueriesContext(connection) as captured:
+            author.delete()
+        updates = [
+            query['sql'] for query in captured.captured_queries
+            if query['sql'].startswith('UPDATE')
+            and '_count' in query['sql']
+        ]
+        self.assertLessEqual(len(updates), 3)
+        self.assert_counters_consistent()
+
+    def test_recount_counters(self):
+        recipe = Recipe.objects.create(
+            name='рецепт', author=self.author, image='recipe.png',
+            text='описание', cooking_time=10)
+        BestRecipes.objects.create(user=self.user, recipe=recipe)
+        Recipe.objects.update(favorites_count=5)
+        out = StringIO()
+        call_command('recount_counters', '--check', stdout=out)
+        self.assertIn('расхождений: 1', out.getvalue())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 5)
+        call_command('recount_counters', stdout=out)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_fill_counters_migration(self):
+        migration = import_module('recipes.migrations.0011_fill_counters')
+        recipe = Recipe.objects.create(
+            name='рецепт', author=self.author, image='recipe.png',
+            text='описание', cooking_time=10)
+        BestRecipes.objects.create(user=self.user, recipe=recipe)
+        Follow.objects.create(user=self.user, author=self.author)
+        Recipe.objects.update(favorites_count=0)
+        User.objects.update(recipes_count=0, followers_count=0)
+        migration.fill_counters(django_apps, None)
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.author.followers_count, 1)
+        BestRecipes.objects.all().delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+
+
+class IngredientSearchTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Абрикос', 'абрикосовый джем', 'Ананас', 'баклажаны',
+                     'ёжевика'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        ingredient_index.invalidate()
+        self.client.force_authenticate(User(id=1))
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        return [item['name'] for item in response.data]
+
+    def test_prefix(self):
+        self.assertEqual(self.search('АБРИК'),
+                         ['Абрикос', 'абрикосовый джем'])
+        self.assertEqual(self.search('еж'), ['ёжевика'])
+        with self.assertNumQueries(0):
+            self.search('ан')
+
+    def test_typo(self):
+        self.assertEqual(self.search('бакложан'), ['баклажаны'])
+        self.assertEqual(self.search('кукуруза'), [])
+
+    def test_limit(self):
+        with self.settings(INGREDIENT_SEARCH_LIMIT=1):
+            self.assertEqual(self.search('а'), ['Абрикос'])
+
+
+class IngredientIndexInvalidationTest(APITransactionTestCase):
+
+    def setUp(self):
+        Ingredient.objects.create(name='Ананас', measurement_unit='г')
+        ingredient_index.invalidate()
+        self.client.force_authenticate(User(id=1))
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        return [item['name'] for item in response.data]
+
+    def test_invalidated_on_commit(self):
+        self.assertEqual(self.search('ан'), ['Ананас'])
+        with transaction.atomic():
+            Ingredient.objects.create(name='анис', measurement_unit='г')
+            self.assertEqual(self.search('ан'), ['Ананас'])
+        self.assertEqual(self.search('ан'), ['Ананас', 'анис'])
+
+    def test_rollback_keeps_index(self):
+        self.assertEqual(self.search('ан'), ['Ананас'])
+        with transaction.atomic():
+            Ingredient.objects.create(name='анис', measurement_unit='г')
+            transaction.set_rollback(True)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('ан'), ['Ананас'])
+
+
+class ShoppingCartDownloadTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        recipe = Recipe.objects.create(
+            name='рецепт', author=cls.user, image='recipe.png',
+            text='описание', cooking_time=10)
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(
+                recipe=recipe, amount=i + 1,
+                ingredient=Ingredient.objects.create(
+                    name=f'ингредиент {i:02}', measurement_unit='г'))
+            for i in range(60)
+        )
+        ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def download(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        return b''.join(response.streaming_content)
+
+    def test_pages(self):
+        content = self.download()
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertEqual(content.count(b'/Type /Page\n'), 3)
+
+    def test_cached(self):
+        with mock.patch.object(shopping_list, 'render_pdf',
+                               wraps=shopping_list.render_pdf) as render:
+            first = self.download()
+            second = self.download()
+        self.assertEqual(first, second)
+        self.assertEqual(render.call_count, 1)
+
+    def test_formats(self):
+        url = '/api/recipes/download_shopping_cart/'
+        response = self.client.get(url, {'format': 'txt'})
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[2], '1. ингредиент 00  1 г.')
+        response = self.client.get(url, HTTP_ACCEPT='text/csv')
+        self.assertIn('shopping_list.csv', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[:2], ['name,measurement_unit,amount',
+                                     'ингредиент 00,г,1'])
+        response = self.client.get(url, {'format': 'json'})
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(data), 60)
+        self.assertEqual(data[-1], {'name': 'ингредиент 59',
+                                    'measurement_unit': 'г', 'amount': 60})
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeWriteTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        cls.tag = Tag.objects.create(name='тэг', color='#000000', slug='tag')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(20)
+        ]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def payload(self, ingredients):
+        return {
+            'name': 'рецепт',
+            'text': 'описание',
+            'cooking_time': 10,
+            'tags': [self.tag.id],
+            'image': IMAGE,
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in ingredients
+            ],
+        }
+
+    def create(self, ingredients):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/api/recipes/', self.payload(ingredients), format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Recipe.objects.get(id=response.data['id']), len(queries)
+
+    def amounts(self, recipe):
+        return dict(recipe.ingredients_amount.values_list(
+            'ingredient_id', 'amount'))
+
+    def test_create_query_count_is_constant(self):
+        _, few = self.create([(self.ingredients[0], 1)])
+        recipe, many = self.create([(i, 2) for i in self.ingredients])
+        self.assertEqual(few, many)
+        self.assertEqual(len(self.amounts(recipe)), 20)
+
+    def test_duplicates_are_merged(self):
+        first, second = self.ingredients[:2]
+        recipe, _ = self.create([(first, 2), (first, 3), (second, 1)])
+        self.assertEqual(self.amounts(recipe), {first.id: 5, second.id: 1})
+
+    def test_update_diffs_ingredients(self):
+        first, second, third = self.ingredients[:3]
+        recipe, _ = self.create([(first, 2), (second, 1)])
+        kept = recipe.ingredients_amount.get(ingredient=first).id
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            self.payload([(first, 4), (third, 1)]), format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.amounts(recipe), {first.id: 4, third.id: 1})
+        self.assertEqual(
+            recipe.ingredients_amount.get(ingredient=first).id, kept)
+
+    def test_unknown_ingredient(self):
+        payload = self.payload([(self.ingredients[0], 1)])
+        payload['ingredients'].append({'id': 10 ** 6, 'amount': 1})
+        response = self.client.post('/api/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_renditions(self):
+        recipe, _ = self.create([(self.ingredients[0], 1)])
+        self.assertEqual(make_renditions(recipe.image.name), 4)
+        self.assertEqual(make_renditions(recipe.image.name, force=False), 0)
+        for name in rendition_names(recipe.image.name):
+            self.assertTrue(default_storage.exists(name), name)
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        renditions = response.data['renditions']
+        self.assertEqual(set(renditions), {'small', 'medium'})
+        self.assertTrue(renditions['small']['webp'].endswith('_small.webp'))
+
+    @override_settings(IMAGE_MAX_SIZE=32)
+    def test_encoded_size_is_capped(self):
+        payload = self.payload([(self.ingredients[0], 1)])
+        response = self.client.post('/api/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+
+    @override_settings(IMAGE_MAX_PIXELS=0)
+    def test_pixel_count_is_capped(self):
+        payload = self.payload([(self.ingredients[0], 1)])
+        response = self.client.post('/api/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+
+    @override_settings(RECIPE_MAX_BODY_SIZE=100)
+    def test_body_size_is_capped(self):
+        payload = self.payload([(self.ingredients[0], 1)])
+        response = self.client.post('/api/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, 413)
+
+    @override_settings(IMAGE_DECODE_CHUNK_SIZE=1000)
+    def test_wrapped_base64(self):
+        image = BytesIO()
+        Image.effect_noise((100, 100), 64).save(image, 'PNG')
+        encoded = base64.encodebytes(image.getvalue()).decode()
+        self.assertGreater(len(encoded), 1000)
+        payload = self.payload([(self.ingredients[0], 1)])
+        payload['image'] = f'data:image/png;base64,{encoded}'
+        response = self.client.post('/api/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(recipe.image.read(), image.getvalue())
+
+    def test_multipart_upload(self):
+        first, second = self.ingredients[:2]
+        payload = self.payload([])
+        payload['ingredients'] = json.dumps([
+            {'id': first.id, 'amount': 2}, {'id': second.id, 'amount': 3}])
+        payload['image'] = SimpleUploadedFile(
+            'image.png', base64.b64decode(IMAGE.split(',')[1]))
+        response = self.client.post(
+            '/api/recipes/', payload, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(self.amounts(recipe), {first.id: 2, second.id: 3})
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+
+
+class LoadDataTest(APITestCase):
+
+    def load(self, content, suffix, *args):
+        with tempfile.NamedTemporaryFile(
+                'w', suffix=suffix, encoding='utf-8') as file:
+            file.write(content)
+            file.flush()
+            out = StringIO()
+            call_command('load_data', file.name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv_and_json_are_deduplicated(self):
+        self.load('соль,г\nсоль,г\nсахар,г\n', '.csv')
+        self.load(json.dumps([
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'соль', 'measurement_unit': 'щепотка'},
+        ]), '.json')
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list(
+                'name', 'measurement_unit')),
+            [('сахар', 'г'), ('соль', 'г'), ('соль', 'щепотка')])
+
+    def test_dry_run(self):
+        generation = get_generation('ingredients')
+        out = self.load('соль,г\n', '.csv', '--dry-run')
+        self.assertIn('будет добавлено 1', out)
+        self.assertFalse(Ingredient.objects.exists())
+        self.assertEqual(get_generation('ingredients'), generation)
+
+    def test_invalidates_cache(self):
+        cache.clear()
+        self.assertEqual(self.client.get('/api/ingredients/').data, [])
+        self.load('соль,г\n', '.csv')
+        response = self.client.get('/api/ingredients/')
+        self.assertEqual([item['name'] for item in response.data], ['соль'])
+
+
+class UniqueIngredientMigrationTest(TransactionTestCase):
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([target])
+        return executor.loader.project_state([target]).apps
+
+    def test_duplicates_merged(self):
+        leaf = MigrationExecutor(connection).loader.graph.leaf_nodes('recipes')
+        apps = self.migrate(('recipes', '0003_counters'))
+        ingredients = apps.get_model('recipes', 'Ingredient').objects
+        recipes = apps.get_model('recipes', 'Recipe').objects
+        amounts = apps.get_model('recipes', 'IngredientsInRecipe').objects
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        salt, *copies = [
+            ingredients.create(name='соль', measurement_unit='г')
+            for _ in range(3)
+        ]
+        both, copy_only = [
+            recipes.create(
+                name=name, author_id=author.id, image='recipe.png',
+                text='описание', cooking_time=10)
+            for name in ('обе', 'копия')
+        ]
+        amounts.create(recipe=both, ingredient=salt, amount=1)
+        amounts.create(recipe=both, ingredient=copies[0], amount=2)
+        amounts.create(recipe=copy_only, ingredient=copies[1], amount=3)
+        self.migrate(leaf[0])
+        self.assertEqual(
+            list(Ingredient.objects.values_list('id', flat=True)), [salt.id])
+        self.assertEqual(
+            sorted(IngredientsInRecipe.objects.values_list(
+                'recipe_id', 'ingredient_id', 'amount')),
+            [(both.id, salt.id, 3), (copy_only.id, salt.id, 3)])
+
+
+class ShoppingCartTotalsTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        cls.salt, cls.sugar, cls.flour = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'сахар', 'мука')
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, amounts):
+        recipe = Recipe.objects.create(
+            name='рецепт', author=self.user, image='recipe.png',
+            text='описание', cooking_time=10)
+        RecipeCreateSerializer().set_ingredients(recipe, {
+            ingredient.id: amount for ingredient, amount in amounts
+        }, created=True)
+        return recipe
+
+    def totals(self):
+        response = self.client.get('/api/recipes/shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+        return {item['name']: item['amount'] for item in response.data}
+
+    def test_totals_follow_cart_and_recipe_changes(self):
+        first = self.create_recipe([(self.salt, 5), (self.sugar, 10)])
+        second = self.create_recipe([(self.salt, 1)])
+        ShoppingList.objects.create(user=self.user, recipe=first)
+        ShoppingList.objects.create(user=self.user, recipe=second)
+        self.assertEqual(self.totals(), {'соль': 6, 'сахар': 10})
+        RecipeCreateSerializer().set_ingredients(
+            Recipe.objects.get(id=first.id),
+            {self.salt.id: 2, self.flour.id: 3})
+        self.assertEqual(self.totals(), {'соль': 3, 'мука': 3})
+        second.delete()
+        self.assertEqual(self.totals(), {'соль': 2, 'мука': 3})
+        ShoppingList.objects.filter(recipe=first).delete()
+        self.assertEqual(self.totals(), {})
+
+    def test_recipe_delete_updates_carts_once(self):
+        kept = self.create_recipe([(self.salt, 1)])
+        deleted = self.create_recipe([(self.salt, 5), (self.sugar, 10)])
+        for i in range(5):
+            user = User.objects.create_user(
+                username=f'buyer{i}', email=f'buyer{i}@example.com',
+                password='pass')
+            ShoppingList.objects.create(user=user, recipe=kept)
+            ShoppingList.objects.create(user=user, recipe=deleted)
+        with CaptureQueriesContext(connection) as captured:
+            deleted.delete()
+        cart_reads = [
+            query['sql'] for query in captured.captured_queries
+            if query['sql'].startswith('SELECT')
+            and 'FROM "recipes_shoppingcartingredient"' in query['sql']
+        ]
+        self.assertEqual(len(cart_reads), 1)
+        carts = dict(ShoppingCartIngredient.objects.values_list(
+            'user__username', 'amount').filter(ingredient=self.salt))
+        self.assertEqual(set(carts.values()), {1})
+        self.assertEqual(len(carts), 5)
+        self.assertFalse(ShoppingCartIngredient.objects.filter(
+            ingredient=self.sugar).exists())
+
+    def test_users_locked_before_cart_rows(self):
+        with CaptureQueriesContext(connection) as captured:
+            apply_cart_changes([self.user.id], {self.salt.id: 1})
+        selects = [
+            query['sql'] for query in captured.captured_queries
+            if query['sql'].startswith('SELECT')
+        ]
+        self.assertIn('FROM "users_user"', selects[0])
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', selects[0])
+        self.assertEqual(self.totals(), {'соль': 1})
+
+    def test_rebuild(self):
+        recipe = self.create_recipe([(self.salt, 5)])
+        ShoppingList.objects.create(user=self.user, recipe=recipe)
+        ShoppingCartIngredient.objects.update(amount=100)
+        call_command('rebuild_shopping_carts', stdout=StringIO())
+        self.assertEqual(self.totals(), {'соль': 5})
+
+
+class HotPathPlanTest(APITestCase):
+    """Проверяет по EXPLAIN, что фильтры ленты идут по индексам."""
+    large_tables = (
+        'recipes_recipe', 'recipes_recipe_tags', 'recipes_bestrecipes',
+        'recipes_shoppinglist', 'recipes_ingredientsinrecipe',
+        'recipes_shoppingcartingredient', 'users_follow', 'users_user',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        tag = Tag.objects.create(name='тэг', color='#000000', slug='tag')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        for i in range(50):
+            recipe = Recipe.objects.create(
+                name=f'рецепт {i}', author=cls.user, image='recipe.png',
+                text='описание', cooking_time=10)
+            recipe.tags.add(tag)
+            IngredientsInRecipe.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=1)
+            if i % 2:
+                BestRecipes.objects.create(user=cls.user, recipe=recipe)
+                ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assert_indexed(self, queryset, ordered=False):
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            for table in self.large_tables:
+                full_scan = (
+                    f'Seq Scan on {table} ' in f'{line} '
+                    or f'SCAN {table}' in line and 'INDEX' not in line
+                    or f'SCAN TABLE {table}' in line and 'INDEX' not in line
+                )
+                self.assertFalse(full_scan, f'{table}:\n{plan}')
+        if ordered:
+            self.assertNotIn('TEMP B-TREE FOR ORDER BY', plan)
+            self.assertNotRegex(plan, r'(?m)^\s*(->\s*)?Sort ')
+
+    def test_recipe_feed(self):
+        self.assert_indexed(Recipe.objects.all()[:6], ordered=True)
+        self.assert_indexed(
+            Recipe.objects.filter(author=self.user)[:6], ordered=True)
+        # порядок курсорной пагинации
+        self.assert_indexed(
+            Recipe.objects.order_by('-pub_date', '-id')[:6], ordered=True)
+        self.assert_indexed(
+            Recipe.objects.filter(author=self.user).order_by(
+                '-pub_date', '-id')[:6], ordered=True)
+
+    def test_subscription_feed(self):
+        # рецепты нескольких авторов приходят из индекса по автору
+        # отдельными упорядоченными кусками, так что сортировка остаётся
+        self.assert_indexed(
+            Recipe.objects.filter(author__in=Follow.objects.filter(
+                user=self.user).values('author')).order_by(
+                '-pub_date', '-id')[:6])
+
+    def test_recipe_filters(self):
+        self.assert_indexed(
+            Recipe.objects.filter(tags__slug__in=['tag']).distinct()[:6])
+        self.assert_indexed(Recipe.objects.filter(favorites__user=self.user))
+        self.assert_indexed(Recipe.objects.filter(basket__user=self.user))
+
+    def test_user_lookups(self):
+        self.assert_indexed(User.objects.filter(following__user=self.user))
+        self.assert_indexed(self.user.shopping_cart_ingredients.all())
+        self.assert_indexed(BestRecipes.objects.filter(
+            user=self.user, recipe_id__in=(1, 2)))
+        self.assert_indexed(
+            IngredientsInRecipe.objects.filter(recipe_id__in=(1, 2)))
+
+
+class AnonymousCacheTest(APITransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        stats.clear()
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.tag = Tag.objects.create(
+            name='тэг', color='#000000', slug='tag')
+        self.recipe = Recipe.objects.create(
+            name='рецепт', author=self.author, image='recipe.png',
+            text='описание', cooking_time=10)
+
+    def test_hits_and_query_order(self):
+        self.client.get('/api/recipes/', {'tags': 'tag', 'page': 1})
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/api/recipes/', {'page': 1, 'tags': 'tag'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stats, {'hits': 1, 'misses': 1})
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.client.force_authenticate(self.author)
+        self.client.get('/api/tags/')
+        self.client.get('/api/tags/')
+        self.assertEqual(stats, {})
+
+    def test_invalidation(self):
+        self.assertEqual(len(self.client.get('/api/tags/').data), 1)
+        self.client.get(f'/api/recipes/{self.recipe.id}/')
+        Tag.objects.create(name='новый', color='#ffffff', slug='new')
+        self.assertEqual(len(self.client.get('/api/tags/').data), 2)
+        self.recipe.tags.add(self.tag)
+        response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(len(response.data['tags']), 1)
+        self.assertEqual(stats, {'misses': 4})
+
+    def test_counters_match_etag(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        first = self.client.get(url)
+        self.assertEqual(first.data['favorites_count'], 0)
+        BestRecipes.objects.create(user=self.author, recipe=self.recipe)
+        second = self.client.get(url)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.data['favorites_count'], 1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=second['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class ConditionalGetTest(APITransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        self.recipe = Recipe.objects.create(
+            name='рецепт', author=self.user, image='recipe.png',
+            text='описание', cooking_time=10)
+        self.url = f'/api/recipes/{self.recipe.id}/'
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_detail(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.get(self.url, etag)
+        self.assertEqual(response.status_code, 304)
+        BestRecipes.objects.create(user=self.user, recipe=self.recipe)
+        response = self.get(self.url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_lists(self):
+        for url in ('/api/recipes/', '/api/tags/', '/api/ingredients/'):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get(url, etag).status_code, 304)
+        etag = self.client.get('/api/tags/')['ETag']
+        Tag.objects.create(name='тэг', color='#000000', slug='tag')
+        self.assertEqual(self.get('/api/tags/', etag).status_code, 200)
+        etag = self.client.get('/api/recipes/')['ETag']
+        self.assertNotEqual(
+            self.get('/api/recipes/?limit=1', etag)['ETag'], etag)
+        self.recipe.save()
+        self.assertEqual(self.get('/api/recipes/', etag).status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedStorageTest(APITransactionTestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.content = base64.b64decode(IMAGE.split(',')[1])
+
+    def create(self, content, name='Unknown222.png'):
+        return Recipe.objects.create(
+            name='рецепт', author=self.author, text='описание',
+            cooking_time=10, image=ContentFile(content, name=name))
+
+    def test_identical_uploads_share_file(self):
+        first = self.create(self.content)
+        second = self.create(self.content, name='другое имя.PNG')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith('images/'))
+        self.assertTrue(first.image.name.endswith('.png'))
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_concurrent_identical_upload(self):
+        storage = Recipe.image.field.storage
+        name = storage.save('a.png', ContentFile(self.content))
+        with mock.patch.object(storage, 'exists', return_value=False):
+            self.assertEqual(
+                storage.save('b.png', ContentFile(self.content)), name)
+
+    def test_replaced_image_kept_until_collected(self):
+        recipe = self.create(self.content)
+        name = recipe.image.name
+        recipe.image = ContentFile(self.content + b'\0', name='new.png')
+        recipe.save()
+        storage = recipe.image.storage
+        self.assertTrue(storage.exists(name))
+        call_command('collect_images', stdout=StringIO())
+        self.assertTrue(storage.exists(name))
+        with override_settings(IMAGE_ORPHAN_GRACE=-1):
+            call_command('collect_images', stdout=StringIO())
+        self.assertFalse(storage.exists(name))
+        self.assertTrue(storage.exists(recipe.image.name))
+
+    def test_collect_images(self):
+        legacy = default_storage.save('Unknown222.png', ContentFile(b'x'))
+        orphan = default_storage.save('Unknown222.png', ContentFile(b'x'))
+        recipe = self.create(self.content)
+        Recipe.objects.filter(pk=recipe.pk).update(image=legacy)
+        with override_settings(IMAGE_ORPHAN_GRACE=-1):
+            call_command('collect_images', stdout=StringIO())
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image.name.startswith('images/'))
+        self.assertFalse(default_storage.exists(legacy))
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(recipe.image.name))
+
+
+class SimilarRecipesTest(APITransactionTestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.tags = [
+            Tag.objects.create(name=f'тэг {i}', color=f'#00000{i}',
+                               slug=f'tag{i}')
+            for i in range(2)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(6)
+        ]
+
+    def create(self, ingredients, tags=()):
+        recipe = Recipe.objects.create(
+            name='рецепт', author=self.author, image='recipe.png',
+            text='описание', cooking_time=10)
+        recipe.tags.set(self.tags[i] for i in tags)
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(recipe=recipe, amount=1,
+                                ingredient=self.ingredients[i])
+            for i in ingredients
+        )
+        return recipe
+
+    def similar(self, recipe):
+        response = self.client.get(f'/api/recipes/{recipe.id}/similar/')
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data]
+
+    def test_ranking_and_serving(self):
+        base = self.create((0, 1, 2), tags=(0,))
+        close = self.create((0, 1, 3), tags=(0,))
+        far = self.create((2, 4, 5), tags=(1,))
+        self.create((5,))
+        out = StringIO()
+        call_command('compute_similar_recipes', stdout=out)
+        self.assertIn('сохранено', out.getvalue())
+        with self.assertNumQueries(1):
+            self.assertEqual(self.similar(base), [close.id, far.id])
+        response = self.client.get('/api/recipes/0/similar/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_incremental_update(self):
+        base = self.create((0, 1), tags=(0,))
+        other = self.create((2, 3))
+        self.create((4, 5))
+        compute_similar()
+        self.assertEqual(self.similar(base), [])
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{other.id}/',
+            {'ingredients': [{'id': self.ingredients[0].id, 'amount': 1},
+                             {'id': self.ingredients[1].id, 'amount': 1}],
+             'tags': [self.tags[0].id]},
+            format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.similar(base), [other.id])
+        self.assertEqual(self.similar(other), [base.id])
+
+    @override_settings(SIMILAR_RECIPES_TOP_K=1)
+    def test_update_enters_other_lists(self):
+        first = self.create((0, 1))
+        self.create((1, 2))
+        self.create((1, 3, 4))
+        changed = self.create((5,))
+        # без посторонних рецептов у ингредиента 1 был бы нулевой IDF
+        self.create((5,))
+        self.create((2, 5))
+        compute_similar()
+        IngredientsInRecipe.objects.filter(recipe=changed).delete()
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(recipe=changed, amount=1,
+                                ingredient=self.ingredients[i])
+            for i in (0, 1, 3, 4)
+        )
+        update_similar((changed.id,))
+        incremental = [self.similar(first), self.similar(changed)]
+        self.assertEqual(incremental[0], [changed.id])
+        compute_similar()
+        self.assertEqual(
+            incremental, [self.similar(first), self.similar(changed)])
+
+    @override_settings(SIMILAR_RECIPES_TOP_K=2)
+    def test_update_keeps_lists_short(self):
+        first = self.create((0, 1))
+        second = self.create((0, 1, 2))
+        self.create((3,))
+        self.create((4,))
+        compute_similar()
+        self.assertEqual(self.similar(first), [second.id])
+        added = [self.create(ingredients) for ingredients in (
+            (0, 1), (0, 1, 2), (0, 2))]
+        update_similar([recipe.id for recipe in added])
+        for recipe in (first, second):
+            self.assertEqual(
+                SimilarRecipe.objects.filter(recipe=recipe).count(), 2)
+        incremental = self.similar(first)
+        compute_similar()
+        self.assertEqual(incremental, self.similar(first))
+
+
+class CookTest(APITransactionTestCase):
+
+    def setUp(self):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(5)
+        ]
+        self.recipes = []
+        for ingredients in ((0, 1), (0, 1, 2), (0, 3, 4), (3,)):
+            recipe = Recipe.objects.create(
+                name='рецепт', author=author, image='recipe.png',
+                text='описание', cooking_time=10)
+            for i in ingredients:
+                IngredientsInRecipe.objects.create(
+                    recipe=recipe, ingredient=self.ingredients[i], amount=1)
+            self.recipes.append(recipe)
+        recipe_ingredient_index.invalidate()
+
+    def cook(self, ingredients, missing=0):
+        response = self.client.get('/api/recipes/cook/', {
+            'ingredients': ','.join(
+                str(self.ingredients[i].id) for i in ingredients),
+            'missing': missing,
+        })
+        self.assertEqual(response.status_code, 200, response.data)
+        return [
+            (self.recipes.index(Recipe(id=item['id'])), item['missing'])
+            for item in response.data['results']
+        ]
+
+    def test_coverage_ranking(self):
+        self.assertEqual(self.cook((0, 1)), [(0, 0)])
+        self.assertEqual(self.cook((0, 1), missing=1), [(0, 0), (1, 1)])
+        self.assertEqual(
+            self.cook((0, 1, 3), missing=2),
+            [(0, 0), (3, 0), (2, 1), (1, 1)])
+        response = self.client.get('/api/recipes/cook/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_index_follows_changes(self):
+        self.assertEqual(self.cook((4,)), [])
+        IngredientsInRecipe.objects.filter(
+            recipe=self.recipes[2], ingredient__in=self.ingredients[:4]
+        ).delete()
+        self.assertEqual(self.cook((4,)), [(2, 0)])
+
+    def test_changes_do_not_rebuild_index(self):
+        self.assertEqual(self.cook((3,)), [(3, 0)])
+        built_at = recipe_ingredient_index._built_at
+        IngredientsInRecipe.objects.create(
+            recipe=self.recipes[3], ingredient=self.ingredients[4], amount=1)
+        self.assertEqual(self.cook((3, 4), missing=1), [(3, 0), (2, 1)])
+        self.recipes[2].delete()
+        self.assertEqual(self.cook((3, 4), missing=1), [(3, 0)])
+        self.assertEqual(recipe_ingredient_index._built_at, built_at)
+
+
+class SearchTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        cls.recipes = [
+            Recipe.objects.create(
+                name=name, author=author, image='recipe.png', text=text,
+                cooking_time=10)
+            for name, text in (
+                ('Суп', 'Почти борщ, но без свёклы'),
+                ('Борщ украинский', 'Классический борщ со сметаной'),
+                ('Омлет', 'Яйца и молоко'),
+            )
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_ranked_by_relevance(self):
+        soup, borsch, omelette = self.recipes
+        self.assertEqual(self.search('борщ'), [borsch.id, soup.id])
+        self.assertEqual(self.search('ЯЙЦ'), [omelette.id])
+        self.assertEqual(self.search('борщ сметан'), [borsch.id])
+        self.assertEqual(self.search('"AND (*'), [])
+
+    def test_index_follows_writes(self):
+        omelette = Recipe.objects.get(pk=self.recipes[2].pk)
+        omelette.name = 'Омлет с борщом'
+        omelette.save()
+        self.assertIn(omelette.id, self.search('борщ'))
+        omelette.delete()
+        self.assertNotIn(omelette.id, self.search('омлет'))
+
+    def test_cursor_keeps_relevance(self):
+        borsch = self.recipes[1]
+        Recipe.objects.create(
+            name='Щи', author=borsch.author, image='recipe.png',
+            text='Не борщ', cooking_time=10)
+        response = self.client.get(
+            '/api/recipes/', {'search': 'борщ', 'cursor': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['id'], borsch.id)
+
+    @skipUnless(connection.vendor == 'sqlite', 'триггеры FTS5 SQLite')
+    def test_triggers_restored_after_migrate(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER recipes_recipe_fts_insert')
+        emit_post_migrate_signal(0, False, connection.alias)
+        recipe = Recipe.objects.create(
+            name='Блины', author=self.recipes[0].author, image='recipe.png',
+            text='На молоке', cooking_time=10)
+        self.assertEqual(self.search('блины'), [recipe.id])
+
+
+class GenerateDatasetTest(APITestCase):
+
+    def generate(self):
+        call_command(
+            'generate_dataset', '--users', 30, '--recipes', 200,
+            '--ingredients', 50, '--seed', 7, '--batch-size', 64,
+            stdout=StringIO())
+        return list(Recipe.objects.order_by('id').values_list(
+            'name', 'author__username', 'cooking_time'))
+
+    def test_generate(self):
+        first = self.generate()
+        self.assertEqual(len(first), 200)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertTrue(IngredientsInRecipe.objects.exists())
+        self.assertTrue(Follow.objects.exists())
+        out = StringIO()
+        call_command('recount_counters', '--check', stdout=out)
+        self.assertIn('счётчики в порядке', out.getvalue())
+        carts = ShoppingList.objects.values('user').distinct().count()
+        self.assertEqual(
+            ShoppingCartIngredient.objects.values('user').distinct().count(),
+            carts)
+        recipe = Recipe.objects.create(
+            name='новый', author=User.objects.first(), image='recipe.png',
+            text='описание', cooking_time=10)
+        self.assertGreater(recipe.id, 200)
+        User.objects.all().delete()
+        self.assertEqual(self.generate(), first)
+
+
+class BenchmarkTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        call_command(
+            'generate_dataset', '--users', 10, '--recipes', 30,
+            '--ingredients', 20, '--seed', 3, stdout=StringIO())
+        self.baseline = os.path.join(tempfile.mkdtemp(), 'baseline.json')
+
+    def benchmark(self, *args):
+        call_command(
+            'benchmark', '--iterations', 2, '--warmup', 0, '--only', 'detail',
+            *args, stdout=StringIO())
+
+    def test_baseline(self):
+        recipes = Recipe.objects.count()
+        self.benchmark('--save', self.baseline)
+        self.assertEqual(Recipe.objects.count(), recipes)
+        with open(self.baseline, encoding='utf-8') as file:
+            results = json.load(file)
+        self.assertEqual(set(results), {'detail anonymous', 'detail'})
+        self.assertGreater(results['detail']['queries'], 0)
+        self.benchmark('--baseline', self.baseline, '--tolerance', 1000)
+        for result in results.values():
+            result['queries'] = 0
+        with open(self.baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file)
+        with self.assertRaisesMessage(CommandError, 'detail'):
+            self.benchmark('--baseline', self.baseline, '--tolerance', 1000)
+
+    def test_media_and_on_commit(self):
+        media_root = tempfile.mkdtemp()
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command(
+                'benchmark', '--iterations', 1, '--warmup', 0,
+                '--only', 'create', stdout=StringIO())
+        self.assertEqual(os.listdir(media_root), [])
+        self.assertEqual(connection.run_on_commit, [])
+
+
+class MetricsTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        cls.recipe = Recipe.objects.create(
+            name='рецепт', author=author, image='recipe.png',
+            text='описание', cooking_time=10)
+
+    def setUp(self):
+        cache.clear()
+
+    def sample(self, metric, route):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        prefix = f'{metric}{{method="GET",route="{route}"}} '
+        for line in response.content.decode().splitlines():
+            if line.startswith(prefix):
+                return float(line[len(prefix):])
+        return 0
+
+    def test_metrics(self):
+        before = self.sample('foodgram_request_seconds_count', 'recipe-list')
+        queries = self.sample('foodgram_sql_queries_sum', 'recipe-list')
+        self.client.get('/api/recipes/')
+        self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(
+            self.sample('foodgram_request_seconds_count', 'recipe-list'),
+            before + 1)
+        self.assertGreater(
+            self.sample('foodgram_sql_queries_sum', 'recipe-list'), queries)
+        self.assertGreater(
+            self.sample('foodgram_response_bytes_sum', 'recipe-detail'), 0)
+        self.assertGreater(
+            self.sample('foodgram_render_seconds_count', 'recipe-detail'), 0)
+        self.assertGreater(
+            self.sample('foodgram_serializer_seconds_count', 'recipe-detail'),
+            0)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('foodgram_api_cache_total{result="misses"}', body)
+        self.assertIn('le="+Inf"', body)
+
+    def test_forbidden(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(PROFILE_SAMPLE_RATE=1, PROFILE_SLOW_REQUEST=0)
+    def test_profile_slow_request(self):
+        with self.assertLogs('foodgram.performance', 'WARNING') as logs:
+            self.client.get('/api/recipes/')
+        self.assertIn('recipe-list', logs.output[0])
+        self.assertIn('cumulative', logs.output[0])
+
+
+class QueryBudgetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(2)
+        ]
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                name=f'рецепт {i}', author=cls.admin, image='recipe.png',
+                text='описание', cooking_time=10)
+            IngredientsInRecipe.objects.bulk_create(
+                IngredientsInRecipe(recipe=recipe, ingredient=ingredient,
+                                    amount=5)
+                for ingredient in ingredients
+            )
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql(
+                "SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x'"
+                ' LIMIT 21'),
+            "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?")
+
+    def test_duplicates(self):
+        with self.assertRaises(QueryBudgetExceeded) as error:
+            with assert_query_budget(duplicates=2):
+                for recipe in Recipe.objects.all():
+                    list(recipe.ingredients.all())
+        report = str(error.exception)
+        self.assertIn('5 × SELECT', report)
+        self.assertIn('recipes/tests.py', report)
+        with assert_query_budget(2, duplicates=1):
+            list(Recipe.objects.prefetch_related('ingredients'))
+
+    def test_budget(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'при бюджете 1'):
+            with assert_query_budget(1):
+                Recipe.objects.count()
+                Ingredient.objects.count()
+
+    def test_view_budget(self):
+        view = RecipeViewSet.as_view({'get': 'feed'})
+        self.assertEqual(get_view_budget(view, 'GET').queries, 8)
+        view = RecipeViewSet.as_view({'get': 'list'})
+        self.assertEqual(get_view_budget(view, 'GET').queries, 30)
+
+    @override_settings(QUERY_BUDGET_MODE='raise')
+    def test_admin_changelist(self):
+        self.client.force_login(self.admin)
+        # changelist считает строки дважды: всего и после фильтров
+        with assert_query_budget(duplicates=2):
+            response = self.client.get('/admin/recipes/recipe/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'ингредиент 1')
+
+    @override_settings(QUERY_BUDGET_MODE='log', QUERY_BUDGET_DUPLICATES=0)
+    def test_log_mode(self):
+        cache.clear()
+        with self.assertLogs('foodgram.performance', 'WARNING') as logs:
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('GET /api/recipes/', logs.output[0])
+
+    @override_settings(QUERY_BUDGET_MODE='raise', QUERY_BUDGET_DUPLICATES=0)
+    def test_undeclared_view_not_checked(self):
+        self.assertIsNone(
+            get_view_budget(TagViewSet.as_view({'get': 'list'}), 'GET'))
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
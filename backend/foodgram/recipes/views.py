@@ -1,52 +1,118 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from foodgram.settings import FILE_NAME
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
+from foodgram.query_budget import QueryBudget, limit_queries
+from foodgram.settings import COOK_MAX_MISSING, FILE_NAME
 from rest_framework import generics, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from recipes.filters import CustomSearchFilter, RecipeFilter
-from recipes.mixins import ListRetriveViewSet
+from recipes.filters import RecipeFilter
+from recipes.cache import (cache_for_anonymous, conditional_get,
+                           get_generation, make_etag, user_generation_name)
+from recipes.mixins import (AnonymousCacheMixin, ConditionalGetMixin,
+                            ListRetriveViewSet)
 from recipes.models import (BestRecipes, Ingredient, IngredientsInRecipe,
                             Recipe, ShoppingList, Tag)
+from recipes.parsers import RecipeJSONParser, RecipeMultiPartParser
 from recipes.permissions import Author, ReadOnly
+from recipes.renderers import (CSVRenderer, JSONListRenderer, PDFRenderer,
+                               PlainTextRenderer)
+from recipes.search import ingredient_index, recipe_ingredient_index
 from recipes.serializers import (BestRecipesSerializer,
                                  IngredientListSerializer,
                                  IngredientSerializer, RecipeCreateSerializer,
                                  RecipeSerializer, ShoppingListSerializer,
-                                 TagSerializer)
+                                 ShortSerializer, TagSerializer)
+from recipes.shopping_list import (EXPORTERS, get_shopping_cart,
+                                   iter_chunks, render_shopping_list)
+from users.models import Follow
+from users.paginator import (CursorOrPageNumberPagination,
+                             LimitCursorPagination, LimitPageNumberPagination)
 
 CONTENT_TYPE = 'application/pdf'
 
 
-class IngredientViewSet(ListRetriveViewSet):
+def parse_ids(values):
+    """Идентификаторы из повторяющегося параметра или через запятую."""
+    return [
+        int(value) for item in values for value in item.split(',')
+        if value.strip().isdigit()
+    ]
+
+
+class IngredientViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                        ListRetriveViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (CustomSearchFilter, )
-    search_fields = ('^name', )
     pagination_class = None
+    cache_generation = 'ingredients'
+
+    @conditional_get
+    @cache_for_anonymous
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None:
+            return Response(ingredient_index.all())
+        return Response(ingredient_index.search(name))
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
+    pagination_class = CursorOrPageNumberPagination
+    parser_classes = (RecipeJSONParser, RecipeMultiPartParser)
+    cache_generation = 'recipes'
+    etag_generations = ('counters',)
+    query_budget = QueryBudget(30)
+
+    def get_etag(self, request):
+        if self.action != 'retrieve':
+            return super().get_etag(request)
+        row = Recipe.objects.filter(pk=self.kwargs['pk']).values_list(
+            'updated', 'favorites_count', 'shopping_cart_count').first()
+        if row is None:
+            return None
+        parts = [*row, get_generation('tags'), get_generation('ingredients')]
+        user = request.user
+        if not user.is_anonymous:
+            parts += [user.id, get_generation(user_generation_name(user.id))]
+        return make_etag(request.path, *parts)
+
+    def get_queryset(self):
+        return Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients_amount',
+                queryset=IngredientsInRecipe.objects.select_related(
+                    'ingredient')
+            ),
+        )
 
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update',):
             return RecipeCreateSerializer
         return RecipeSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+
     @staticmethod
+    @transaction.atomic
     def post_method_for_actions(request, pk, serializers):
         data = {'user': request.user.id, 'recipe': pk}
         serializer = serializers(data=data, context={'request': request})
@@ -55,6 +121,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
+    @transaction.atomic
     def delete_method_for_actions(request, pk, model):
         user = request.user
         recipe = get_object_or_404(Recipe, id=pk)
@@ -90,45 +157,101 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=('GET',),
             permission_classes=(IsAuthenticated,))
+    @limit_queries(8)
+    @conditional_get
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь, от новых
+        к старым. Один запрос с подзапросом по подпискам и курсорная
+        пагинация, поэтому число подписок не влияет на число запросов."""
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            author__in=Follow.objects.filter(
+                user=request.user).values('author'))
+        paginator = LimitCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=('GET',))
+    def cook(self, request):
+        """Рецепты из имеющихся ингредиентов: ?ingredients=1,2,3 и
+        ?missing=k — сколько ингредиентов может не хватать."""
+        ingredient_ids = parse_ids(request.query_params.getlist('ingredients'))
+        missing = request.query_params.get('missing', '0')
+        if not ingredient_ids or not missing.isdigit():
+            raise ValidationError(
+                'укажите ингредиенты и неотрицательное missing')
+        found = recipe_ingredient_index.search(
+            ingredient_ids, min(int(missing), COOK_MAX_MISSING))
+        paginator = LimitPageNumberPagination()
+        page = paginator.paginate_queryset(found, request, view=self)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in page])
+        data = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _ in page if recipe_id
+             in recipes], many=True).data
+        missing = dict(page)
+        for item in data:
+            item['missing'] = missing[item['id']]
+        return paginator.get_paginated_response(data)
+
+    @action(detail=True, methods=('GET',))
+    def similar(self, request, pk):
+        """Похожие рецепты, заранее посчитанные compute_similar_recipes."""
+        recipes = Recipe.objects.filter(similar_to__recipe_id=pk).order_by(
+            '-similar_to__score')[:settings.SIMILAR_RECIPES_TOP_K]
+        data = ShortSerializer(
+            recipes, many=True, context={'request': request}).data
+        if not data and not Recipe.objects.filter(pk=pk).exists():
+            raise Http404
+        return Response(data)
+
+    @action(detail=False, methods=('GET',), url_path='shopping_cart',
+            url_name='shopping-cart-list',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_list(self, request):
+        queryset = request.user.shopping_cart_ingredients.select_related(
+            'ingredient').order_by('ingredient__name')
+        serializer = IngredientListSerializer(queryset, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=('GET',),
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=(PDFRenderer, PlainTextRenderer, CSVRenderer,
+                              JSONListRenderer))
     def download_shopping_cart(self, request):
-        ingredients_in_recipe = IngredientsInRecipe.objects.filter(
-            recipe__basket__user=request.user).values_list(
-                'ingredient__name', 'ingredient__measurement_unit',
-        ).order_by(
-                'ingredient__name').annotate(Sum('amount'))
-        pdfmetrics.registerFont(
-            TTFont('DejaVuSans', 'media/fonts/DejaVuSans.ttf'))
-        response = HttpResponse(content_type=CONTENT_TYPE)
+        ingredients = get_shopping_cart(request.user)
+        renderer = request.accepted_renderer
+        if renderer.format == 'pdf':
+            content = render_shopping_list(list(ingredients))
+            response = StreamingHttpResponse(
+                iter_chunks(content), content_type=CONTENT_TYPE)
+            response['Content-Length'] = len(content)
+        else:
+            response = StreamingHttpResponse(
+                EXPORTERS[renderer.format](ingredients.iterator()),
+                content_type=f'{renderer.media_type}; '
+                             f'charset={renderer.charset}'
+            )
+        filename = os.path.splitext(FILE_NAME)[0]
         response['Content-Disposition'] = (
-            f'attachment; filename = {FILE_NAME}')
-        page = canvas.Canvas(response)
-        page.setFont('DejaVuSans', size=24)
-        page.drawString(50, 100, 'Список ингредиентов')
-        page.setFont('DejaVuSans', size=16)
-        height = 750
-        for i, item in enumerate(ingredients_in_recipe, start=1):
-            page.drawString(75,
-                            height,
-                            (f'{i}. {item[0]} '
-                             f' {item[2]}'
-                             f' {item[1]}.'))
-            height -= 25
-        page.showPage()
-        page.save()
+            f'attachment; filename = {filename}.{renderer.format}')
         return response
 
     def get_permissions(self):
-        if self.action in ('shopping_cart', 'download_shopping_cart',):
+        if self.action in ('shopping_cart', 'shopping_cart_list',
+                           'download_shopping_cart', 'feed',):
             permission_classes = (IsAuthenticated,)
         else:
             permission_classes = (Author | ReadOnly,)
         return tuple([permission() for permission in permission_classes])
 
 
-class TagViewSet(ListRetriveViewSet):
+class TagViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                 ListRetriveViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    cache_generation = 'tags'
 
 
 class IngredientAmountViewSet(generics.ListAPIView):
@@ -10,6 +10,16 @@ class User(AbstractUser):
         help_text='введите email',
         unique=True
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='подписчиков',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ('date_joined',)
@@ -1,6 +1,61 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination)
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class LimitCursorPagination(CursorPagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+
+class FollowCursorPagination(LimitCursorPagination):
+    ordering = ('-follow_id',)
+
+
+class CursorOrPageNumberPagination(BasePagination):
+    """Постраничная выдача, а с параметром ?cursor= — курсорная.
+
+    Курсорная пагинация не считает COUNT(*) и не использует OFFSET,
+    поэтому глубокая прокрутка стоит столько же, сколько первая страница.
+    Первую страницу можно запросить с пустым значением ?cursor=.
+    Если выдача уже упорядочена иначе, например поиском по релевантности,
+    курсор игнорируется: курсорная пагинация пересортировала бы её.
+    """
+    cursor_pagination_class = LimitCursorPagination
+    page_pagination_class = LimitPageNumberPagination
+
+    def __init__(self):
+        self.paginator = self.page_pagination_class()
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.paginator, 'display_page_controls', False)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_class = self.cursor_pagination_class
+        ordering = tuple(queryset.query.order_by)
+        if (cursor_class.cursor_query_param in request.query_params
+                and ordering in ((), cursor_class.ordering)):
+            self.paginator = cursor_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_schema_fields(self, view):
+        return self.paginator.get_schema_fields(view)
+
+    def get_schema_operation_parameters(self, view):
+        return self.paginator.get_schema_operation_parameters(view)
+
+
+class FollowCursorOrPageNumberPagination(CursorOrPageNumberPagination):
+    cursor_pagination_class = FollowCursorPagination
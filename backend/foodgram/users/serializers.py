@@ -1,8 +1,13 @@
+from collections import defaultdict
+
+from django.db.models import F, Manager, Window
+from django.db.models.functions import RowNumber
 from djoser.serializers import (
     UserCreateSerializer as BaseUserRegistrationSerializer)
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from recipes.flags import get_user_flags
 from recipes.models import Recipe
 from users.models import Follow, User
 
@@ -16,6 +21,14 @@ class UserRegistrationSerializer(BaseUserRegistrationSerializer):
         )
 
 
+class CustomUserListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        users = list(data.all() if isinstance(data, Manager) else data)
+        get_user_flags(self.context).load_authors(user.id for user in users)
+        return super().to_representation(users)
+
+
 class CustomUserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
@@ -28,12 +41,57 @@ class CustomUserSerializer(serializers.ModelSerializer):
             'first_name',
             'last_name',
             'is_subscribed', )
+        list_serializer_class = CustomUserListSerializer
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user, author=obj).exists()
+        return get_user_flags(self.context).is_subscribed(obj)
+
+
+def get_recent_recipes(author_ids, limit=None):
+    """Последние рецепты авторов одним запросом: {author_id: [recipe]}.
+
+    Лимит на автора считается окном ROW_NUMBER() OVER (PARTITION BY
+    author). Django 2.2 не умеет фильтровать по оконной функции, поэтому
+    запрос с окном оборачивается в подзапрос через raw().
+    """
+    recipes = defaultdict(list)
+    if not author_ids:
+        return recipes
+    queryset = Recipe.objects.filter(author_id__in=author_ids).order_by(
+        'author_id', '-pub_date', '-id')
+    if limit is not None:
+        ranked = queryset.order_by().annotate(recipe_rank=Window(
+            RowNumber(),
+            partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('id').desc()),
+        ))
+        sql, params = ranked.query.sql_with_params()
+        queryset = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE recipe_rank <= %s '
+            'ORDER BY author_id, recipe_rank',
+            (*params, limit)
+        )
+    for recipe in queryset:
+        recipes[recipe.author_id].append(recipe)
+    return recipes
+
+
+def get_recipes_limit(request):
+    """recipes_limit из запроса; 0 и пустое значение, как и раньше,
+    означают «без ограничения»."""
+    limit = request.query_params.get('recipes_limit', '')
+    return int(limit) if limit.isdigit() and int(limit) else None
+
+
+class FollowListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        authors = list(data.all() if isinstance(data, Manager) else data)
+        self.child.recipes_by_author = get_recent_recipes(
+            [author.id for author in authors],
+            get_recipes_limit(self.context['request'])
+        )
+        return super().to_representation(authors)
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -46,6 +104,7 @@ class FollowSerializer(serializers.ModelSerializer):
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
                   'recipes', 'recipes_count',)
+        list_serializer_class = FollowListSerializer
 
     def get_is_subscribed(self, obj):
         user = self.context.get('request').user
@@ -54,16 +113,16 @@ class FollowSerializer(serializers.ModelSerializer):
         return Follow.objects.filter(user=user, author=obj).exists()
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+        return obj.recipes_count
 
     def get_recipes(self, obj):
         from recipes.serializers import RecipeSubscribeSerializer
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj)
-        if limit:
-            queryset = queryset[:int(limit)]
-        return RecipeSubscribeSerializer(queryset, many=True).data
+        recipes_by_author = getattr(self, 'recipes_by_author', None)
+        if recipes_by_author is None:
+            recipes_by_author = get_recent_recipes(
+                (obj.id,), get_recipes_limit(self.context['request']))
+        return RecipeSubscribeSerializer(
+            recipes_by_author[obj.id], many=True, context=self.context).data
 
 
 class FollowWalidateSerializer(serializers.ModelSerializer):
@@ -0,0 +1,46 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from recipes.cache import bump_generation_on_commit, user_generation_name
+from recipes.models import Recipe
+from recipes.signals import being_deleted, change_counter
+from users.models import Follow, User
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    """Счётчики, которые задевает каскад удаления пользователя, правятся
+    здесь одним UPDATE на счётчик, а не по запросу на каждую строку."""
+    being_deleted(User).add(instance.pk)
+    User.objects.filter(following__user=instance).update(
+        followers_count=F('followers_count') - 1)
+    Recipe.objects.filter(favorites__user=instance).update(
+        favorites_count=F('favorites_count') - 1)
+    Recipe.objects.filter(basket__user=instance).update(
+        shopping_cart_count=F('shopping_cart_count') - 1)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    being_deleted(User).discard(instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    deleting = being_deleted(User)
+    if instance.user_id not in deleting and instance.author_id not in deleting:
+        change_counter(User, instance.author_id, 'followers_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    if instance.user_id not in being_deleted(User):
+        bump_generation_on_commit(user_generation_name(instance.user_id))
@@ -1,5 +1,8 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
 from djoser.views import UserViewSet
+from foodgram.query_budget import QueryBudget
 from rest_framework import status
 from rest_framework.generics import ListAPIView, get_object_or_404
 from rest_framework.permissions import IsAuthenticated
@@ -7,6 +10,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from users.models import Follow
+from users.paginator import FollowCursorOrPageNumberPagination
 from users.serializers import (CustomUserSerializer, FollowSerializer,
                                FollowWalidateSerializer)
 
@@ -17,11 +21,13 @@ class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
     permission_classes = (IsAuthenticated,)
+    query_budget = QueryBudget(8)
 
 
 class FollowViewSet(APIView):
     permission_classes = (IsAuthenticated,)
 
+    @transaction.atomic
     def post(self, request, user_id):
         user = request.user
         data = {
@@ -38,6 +44,7 @@ class FollowViewSet(APIView):
         serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete(self, request, user_id):
         user = request.user
         author = get_object_or_404(User, id=user_id)
@@ -49,6 +56,10 @@ class FollowViewSet(APIView):
 class FollowListView(ListAPIView):
     serializer_class = FollowSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = FollowCursorOrPageNumberPagination
+    query_budget = QueryBudget(6)
 
     def get_queryset(self):
-        return User.objects.filter(following__user=self.request.user)
+        return User.objects.filter(
+            following__user=self.request.user
+        ).annotate(follow_id=F('following__id'))